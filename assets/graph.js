@@ -0,0 +1,81 @@
+'use strict';
+
+// Builds the live graph in the browser from the 'live-window' store (the last
+// week of readings as {t: [epoch ms], y: {column: [values]}}), so switching
+// the parameter or the duration does not need the server. The server only
+// appends new readings to the store (a Dash Patch), so it can also hold some
+// older ones in front; the figure is always cut from the end.
+(function() {
+	var LEVEL_NAMES = {hour: 'hourly', day: 'daily', week: 'weekly'};
+
+	function lowerBound(values, target) {
+		var lo = 0, hi = values.length;
+		while (lo < hi) {
+			var mid = (lo + hi) >>> 1;
+			if (values[mid] < target) { lo = mid + 1; } else { hi = mid; }
+		}
+		return lo;
+	}
+
+	window.dash_clientside = Object.assign({}, window.dash_clientside, {
+		graph: {
+			figure: function(data, column, duration, config) {
+				var layout = {template: config.template};
+				if (!data || !data.t.length) {
+					return {data: [], layout: layout};
+				}
+				var t = data.t;
+				var y = data.y[column] || [];
+				var start = lowerBound(t, t[t.length - 1] - config.durations[duration]);
+				var range = config.ranges[column] || [null, null];
+				return {
+					data: [{type: 'scatter', x: t.slice(start), y: y.slice(start), mode: 'lines+markers', line: {color: 'green'}}],
+					layout: Object.assign(layout, {
+						title: {text: column + ' Vs ' + duration},
+						xaxis: {title: {text: 'Time (hrs)'}, type: 'date'},
+						yaxis: {title: {text: column + ' (' + config.units[column] + ')'}, range: range},
+						height: 600,
+						margin: {l: 50, r: 50, t: 50, b: 50},
+						paper_bgcolor: 'rgba(0,0,0,0)',
+						plot_bgcolor: 'rgba(0,0,0,0)',
+						font: {size: 14}
+					})
+				};
+			},
+			// Long-range history from the 'history-window' store: the mean with a min/max band,
+			// or just the readings when the range was answered with raw rows
+			history: function(data, config) {
+				var layout = {template: config.template};
+				if (!data || !data.t.length) {
+					return {data: [], layout: layout};
+				}
+				var column = data.column;
+				var series = data.y[column];
+				var traces = [];
+				var title = column;
+				if (data.level !== 'raw') {
+					title = column + ' (' + (LEVEL_NAMES[data.level] || data.level) + ' min / mean / max)';
+					traces.push({type: 'scatter', x: data.t, y: series.max, mode: 'lines', line: {width: 0},
+						name: 'max', showlegend: false});
+					traces.push({type: 'scatter', x: data.t, y: series.min, mode: 'lines', line: {width: 0},
+						fill: 'tonexty', fillcolor: 'rgba(0, 128, 0, 0.2)', name: 'min', showlegend: false});
+				}
+				traces.push({type: 'scatter', x: data.t, y: series.mean, mode: 'lines', line: {color: 'green'},
+					name: data.level === 'raw' ? column : 'mean', showlegend: false});
+				return {
+					data: traces,
+					layout: Object.assign(layout, {
+						title: {text: title},
+						xaxis: {type: 'date'},
+						yaxis: {title: {text: column + ' (' + config.units[column] + ')'}},
+						height: 450,
+						margin: {l: 50, r: 50, t: 50, b: 50},
+						paper_bgcolor: 'rgba(0,0,0,0)',
+						plot_bgcolor: 'rgba(0,0,0,0)',
+						font: {size: 14}
+					})
+				};
+			}
+		}
+	});
+})();
@@ -0,0 +1,51 @@
+'use strict';
+
+// Subscribes the dashboard to /events/<site> (Server-Sent Events). Each event
+// only says that a new data version was published (and its latest timestamp);
+// it is written into the 'live-data' store, which is what triggers the
+// dashboard callbacks. While the stream is down the 'interval-component' poll
+// is switched back on.
+(function() {
+	var source = null;
+	var retryTimer = null;
+	var RETRY_MS = 60000;
+
+	function setProps(id, props) {
+		window.dash_clientside.set_props(id, props);
+	}
+
+	function connect(site) {
+		if (source) {
+			source.close();
+			source = null;
+		}
+		clearTimeout(retryTimer);
+		if (!site || !window.EventSource) {
+			setProps('interval-component', {disabled: false});
+			return;
+		}
+		source = new EventSource('/events/' + encodeURIComponent(site));
+		source.onopen = function() {
+			setProps('interval-component', {disabled: true});
+		};
+		source.onmessage = function(event) {
+			setProps('live-data', {data: JSON.parse(event.data)});
+		};
+		source.onerror = function() {
+			setProps('interval-component', {disabled: false});
+			// The browser reconnects by itself unless the stream was refused outright
+			if (source && source.readyState === EventSource.CLOSED) {
+				retryTimer = setTimeout(function() { connect(site); }, RETRY_MS);
+			}
+		};
+	}
+
+	window.dash_clientside = Object.assign({}, window.dash_clientside, {
+		live: {
+			subscribe: function(site) {
+				connect(site);
+				return window.dash_clientside.no_update;
+			}
+		}
+	});
+})();
@@ -0,0 +1,76 @@
+"""Fetch-and-parse cost of the sensor payload: time, peak memory and bytes on the wire.
+
+Compares the buffered path (whole body, json.loads, list of dicts,
+process_data) with the streaming one (incremental gzip and JSON decoding
+straight into typed column blocks), with and without compression.
+
+Usage: python benchmarks/bench_fetch.py [days ...] [--repeat N]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_api import Dataset, create_app, serve_in_thread  # noqa: E402
+from synthetic import generate_records  # noqa: E402
+
+from data_process import collect_columns, process_columns, process_data  # noqa: E402
+from get_data import ApiClient  # noqa: E402
+
+
+def buffered(client):
+    return process_data(client.fetch_data())
+
+
+def streamed(client):
+    return process_columns(collect_columns(client.stream_records()))
+
+
+def measure(func, client, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(client)
+        best = min(best, time.perf_counter() - start)
+    # The stand-in API runs in this process, so the peak includes its encoding of the body
+    tracemalloc.start()
+    func(client)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('days', nargs='*', type=int, default=[30, 365])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'days':>6} {'rows':>8} {'gzip':>5} {'path':<9} {'seconds':>9} {'peak MB':>8} {'wire MB':>8}")
+    for days in args.days:
+        records = generate_records(days)
+        rows = len(records)
+        dataset = Dataset(records)
+        del records
+        for compress in (False, True):
+            server, api_url = serve_in_thread(create_app(dataset, compress=compress))
+            try:
+                client = ApiClient(api_url)
+                for name, func in (('buffered', buffered), ('streamed', streamed)):
+                    seconds, peak = measure(func, client, args.repeat)
+                    stats = client.session.get(api_url + '/stats').json()
+                    # Every request returns the same body, so the average is the size of one
+                    wire = stats['bytes'] / stats['data']
+                    print(f"{days:>6} {rows:>8} {'yes' if compress else 'no':>5} {name:<9} {seconds:>9.4f} "
+                          f"{peak / 1e6:>8.1f} {wire / 1e6:>8.2f}")
+            finally:
+                server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
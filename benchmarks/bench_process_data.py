@@ -0,0 +1,73 @@
+"""Benchmark the typed process_data against the original list-of-dicts version.
+
+Usage: python benchmarks/bench_process_data.py [days ...]
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_process import REQUIRED_COLUMNS, memory_report, process_data  # noqa: E402
+
+
+def legacy_process_data(data):
+    # data_process.process_data before the explicit schema, without its prints
+    df = pd.DataFrame(data)
+    df['timestamp'] = pd.to_datetime(df['timestamp'], format='%d-%b-%Y %H:%M:%S', errors='coerce')
+    required_columns = ['timestamp', 'source_pH', 'source_TDS', 'source_FRC', 'source_pressure', 'source_flow']
+    for col in required_columns:
+        if col not in df.columns:
+            df[col] = None
+    return df.sort_values('timestamp')
+
+
+def make_records(days, seed=0):
+    # API-shaped records: an id string, a formatted timestamp and five readings
+    rng = np.random.default_rng(seed)
+    n = days * 144
+    start = datetime(2024, 1, 1)
+    return [{
+        '_id': f'{i:024x}',
+        'timestamp': (start + timedelta(minutes=10 * i)).strftime('%d-%b-%Y %H:%M:%S'),
+        'source_pH': round(float(rng.uniform(7, 9)), 2),
+        'source_TDS': round(float(rng.uniform(250, 350)), 1),
+        'source_FRC': 0.02,
+        'source_pressure': round(float(rng.uniform(0, 2)), 2),
+        'source_flow': round(float(rng.uniform(0, 6)), 2),
+    } for i in range(n)]
+
+
+def timed(func, *args, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(sizes):
+    # "sensor" is the timestamp plus the five readings, i.e. what the stores keep
+    print(f"{'days':>6} {'rows':>8} {'legacy (s)':>11} {'typed (s)':>10} "
+          f"{'legacy MiB':>11} {'typed MiB':>10} {'sensor legacy':>14} {'sensor typed':>13}")
+    for days in sizes:
+        records = make_records(days)
+        legacy_time, legacy = timed(legacy_process_data, records)
+        typed_time, typed = timed(process_data, records)
+        legacy_mib = legacy.memory_usage(deep=True).sum() / 2 ** 20
+        typed_mib = memory_report(typed).at['total', 'bytes'] / 2 ** 20
+        sensor_legacy = legacy[REQUIRED_COLUMNS].memory_usage(deep=True).sum() / 2 ** 20
+        sensor_typed = typed[REQUIRED_COLUMNS].memory_usage(deep=True).sum() / 2 ** 20
+        print(f"{days:>6} {len(records):>8} {legacy_time:>11.3f} {typed_time:>10.3f} "
+              f"{legacy_mib:>11.2f} {typed_mib:>10.2f} {sensor_legacy:>14.2f} {sensor_typed:>13.2f}")
+    print()
+    print(memory_report(typed))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [30, 365, 3 * 365])
@@ -0,0 +1,92 @@
+"""Benchmark the vectorized pumping engine against the original iterrows loop.
+
+Usage: python benchmarks/bench_pumping.py [days ...]
+"""
+import os
+import sys
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pumping import daily_pumping_summary  # noqa: E402
+
+# The iterrows loop skips the legacy run beyond this many rows
+LEGACY_MAX_ROWS = 200_000
+
+
+def legacy_calculate_pumping_time_and_flow(df):
+    # main.calculate_pumping_time_and_flow before it was vectorized
+    daily_pumping_times = defaultdict(timedelta)
+    daily_flow_sums = defaultdict(float)
+    start_time = None
+    current_day = None
+
+    for _, row in df.iterrows():
+        timestamp = row['timestamp']
+        source_flow = float(row['source_flow'])
+        day = timestamp.date()
+
+        if current_day is None:
+            current_day = day
+        if day != current_day:
+            start_time = None
+            current_day = day
+
+        if source_flow > 0:
+            daily_flow_sums[day] += source_flow
+            if start_time is None:
+                start_time = timestamp
+        elif source_flow == 0 and start_time is not None:
+            end_time = timestamp
+            daily_pumping_times[day] += end_time - start_time
+            start_time = None
+
+    if start_time is not None:
+        end_time = timestamp
+        daily_pumping_times[day] += end_time - start_time
+
+    return daily_pumping_times, daily_flow_sums
+
+
+def make_frame(days, seed=0):
+    # 10-minute samples with two pumping windows a day of random length
+    rng = np.random.default_rng(seed)
+    timestamps = pd.date_range('2024-01-01', periods=days * 144, freq='10min')
+    minutes = timestamps.hour * 60 + timestamps.minute
+    morning = (minutes >= 360) & (minutes < 360 + rng.integers(60, 180))
+    evening = (minutes >= 1080) & (minutes < 1080 + rng.integers(60, 180))
+    flow = np.where(morning | evening, rng.uniform(4, 6, len(timestamps)), 0.0)
+    return pd.DataFrame({'timestamp': timestamps, 'source_flow': flow})
+
+
+def timed(func, *args, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(sizes):
+    print(f"{'days':>6} {'rows':>8} {'legacy (s)':>11} {'vectorized (s)':>15} {'speedup':>8}")
+    for days in sizes:
+        df = make_frame(days)
+        vectorized = timed(daily_pumping_summary, df)
+        if len(df) <= LEGACY_MAX_ROWS:
+            legacy = timed(legacy_calculate_pumping_time_and_flow, df, repeat=1)
+            _, legacy_flow = legacy_calculate_pumping_time_and_flow(df)
+            summary = daily_pumping_summary(df)
+            assert np.isclose(sum(legacy_flow.values()), summary['flow_sum'].sum())
+            print(f"{days:>6} {len(df):>8} {legacy:>11.4f} {vectorized:>15.5f} {legacy / vectorized:>7.0f}x")
+        else:
+            print(f"{days:>6} {len(df):>8} {'-':>11} {vectorized:>15.5f} {'-':>8}")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [7, 30, 365, 3 * 365])
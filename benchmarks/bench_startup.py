@@ -0,0 +1,92 @@
+"""Measure app import time and per-worker memory under gunicorn, with and without preloading.
+
+Usage: python benchmarks/bench_startup.py [--workers N] [--port PORT]
+
+Linux only: worker memory is read from /proc (RSS and PSS, where PSS splits
+pages shared copy-on-write between the workers).
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+
+
+def import_time(repeat=3):
+    timings = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', IMPORT_SNIPPET], cwd=ROOT, capture_output=True,
+                             text=True, check=True).stdout
+        timings.append(float(out.strip().splitlines()[-1]))
+    return min(timings)
+
+
+def worker_pids(master_pid):
+    with open(f'/proc/{master_pid}/task/{master_pid}/children') as f:
+        return [int(pid) for pid in f.read().split()]
+
+
+def memory_kib(pid):
+    usage = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            key, _, rest = line.partition(':')
+            if key in ('Rss', 'Pss'):
+                usage[key] = int(rest.split()[0])
+    return usage
+
+
+def wait_until_ready(port, workers, master, timeout=120):
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=1)
+            if len(worker_pids(master.pid)) >= workers:
+                return time.perf_counter() - start
+        except OSError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError('gunicorn did not come up')
+
+
+def run_gunicorn(preload, workers, port):
+    env = dict(os.environ, PRELOAD_APP='true' if preload else 'false')
+    master = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn_config.py', '--bind', f'127.0.0.1:{port}',
+         '--workers', str(workers), 'main:server'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        ready = wait_until_ready(port, workers, master)
+        # Let every worker finish importing before sampling memory
+        time.sleep(2)
+        usage = [memory_kib(pid) for pid in worker_pids(master.pid)]
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait(timeout=30)
+    return ready, usage
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--port', type=int, default=18000)
+    args = parser.parse_args()
+
+    print(f"import main: {import_time():.2f} s")
+    for preload in (False, True):
+        ready, usage = run_gunicorn(preload, args.workers, args.port)
+        rss = sum(u['Rss'] for u in usage) / len(usage) / 1024
+        pss = sum(u['Pss'] for u in usage) / len(usage) / 1024
+        print(f"preload={str(preload):5}  ready in {ready:5.2f} s  "
+              f"per worker: RSS {rss:6.1f} MiB  PSS {pss:6.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""End-to-end check of late and corrected readings against a full rebuild.
+
+Two DataIngestors (two workers) share a ColumnStore fed by the stand-in API
+(benchmarks/fake_api.py). Each scenario publishes a first version of the
+readings, then changes the API's answer inside the late-data lookback:
+corrected readings, readings that arrive late, pump runs across midnight,
+a corrected latest reading followed by new ones. After every refresh the
+published daily rollup, rolling statistics and history levels of both
+workers must equal the ones rebuilt from the published frame, and the
+frame must hold what the API serves. Exits with status 1 on any mismatch.
+
+Usage: python benchmarks/check_backfill.py [--days N] [--seed N] [--rounds N]
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# Two days of lookback, so corrections from the evening before are picked up
+os.environ.setdefault('LATE_DATA_HOURS', '48')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_api import Dataset, create_app, serve_in_thread  # noqa: E402
+from run_benchmarks import import_app  # noqa: E402
+from synthetic import generate_frame, to_records  # noqa: E402
+
+
+def with_night_runs(frame):
+    # A run from 22:00 to 02:00 every night, so pumping state crosses midnight
+    minute = frame['timestamp'].dt.hour * 60 + frame['timestamp'].dt.minute
+    night = (minute >= 22 * 60) | (minute < 2 * 60)
+    frame.loc[night, 'source_flow'] = 5.0
+    return frame
+
+
+def at(frame, day, time):
+    # Row label of the reading at `time` on the `day`th day from the end (0 = last day)
+    stamp = frame['timestamp'].iloc[-1].normalize() - pd.Timedelta(days=day) + pd.Timedelta(f'{time}:00')
+    return frame.index[frame['timestamp'] == stamp][0]
+
+
+def scenarios(frame, rng, rounds):
+    # (name, [frames the API serves, one per refresh])
+    new = len(frame) - 6
+    yield 'corrected reading before a night run', [frame.iloc[:new], _set(frame.iloc[:new], at(frame, 1, '21:00'),
+                                                                         'source_pH', 8.4)]
+    overnight = [at(frame, 1, t) for t in ('23:00', '23:30', '00:00', '00:30')]
+    yield 'late readings across midnight', [frame.iloc[:new].drop(index=overnight, errors='ignore'), frame.iloc[:new]]
+    yield 'pump switched off before midnight', [frame.iloc[:new], _set(frame.iloc[:new], at(frame, 1, '23:40'),
+                                                                      'source_flow', 0.0)]
+    unknown = frame.iloc[:new].copy()
+    unknown.loc[at(frame, 1, '21:00'):at(frame, 0, '03:00'), 'source_flow'] = np.nan
+    yield 'pump state carried through missing flow', [unknown, _set(unknown, at(frame, 1, '21:00'),
+                                                                    'source_flow', 5.0)]
+    last = frame.index[new - 1]
+    yield 'corrected latest reading, then new ones', [frame.iloc[:new], _set(frame.iloc[:new], last, 'source_flow',
+                                                                            0.0 if frame.loc[last, 'source_flow'] else 5.0),
+                                                     frame]
+
+    # Each round: 12 new readings, 3 of them only arriving a round later, and edits in the lookback
+    edited, versions = frame.copy(), []
+    end = len(frame) - 12 * rounds
+    versions.append(edited.iloc[:end])
+    for _ in range(rounds):
+        served = edited.iloc[:end + 12]
+        lookback = served.index[served['timestamp'] > served['timestamp'].iloc[-1] - pd.Timedelta(hours=40)]
+        labels = rng.choice(lookback, size=5, replace=False)
+        edited.loc[labels, 'source_flow'] = rng.choice([0.0, 5.0, np.nan], size=5)
+        edited.loc[labels, 'source_TDS'] += 1.0
+        held = rng.choice(served.index[end:], size=3, replace=False)
+        versions.append(edited.iloc[:end + 12].drop(index=held))
+        end += 12
+    versions.append(edited.iloc[:end])
+    yield f'{rounds} rounds of random late edits', versions
+
+
+def _set(frame, label, column, value):
+    frame = frame.copy()
+    frame.loc[label, column] = value
+    return frame
+
+
+def compare(name, snapshot, served, windows, ranges):
+    from data_process import SENSOR_SCHEMA, process_data
+    from pyramid import AggregatePyramid
+    from rolling import RollingStats
+    from rollup import DailyRollup
+
+    failures = []
+    expected = process_data(to_records(served)).reset_index(drop=True)
+    frame = snapshot.df.reset_index(drop=True)
+    columns = list(SENSOR_SCHEMA)
+    if not (frame['timestamp'].equals(expected['timestamp'])
+            and np.allclose(frame[columns].to_numpy(dtype=float), expected[columns].to_numpy(dtype=float),
+                            equal_nan=True)):
+        failures.append(f"{name}: the published frame is not what the API serves")
+    tables = {'daily rollup': (snapshot.daily, DailyRollup().rebuild(frame)),
+              'rolling statistics': (snapshot.rolling, RollingStats(windows, ranges).rebuild(frame))}
+    for level, table in AggregatePyramid().rebuild(frame).items():
+        tables[f'{level} level'] = (snapshot.levels[level], table)
+    for label, (got, want) in tables.items():
+        same = got.index.equals(want.index) and list(got.columns) == list(want.columns) and \
+            np.allclose(got.to_numpy(dtype=float), want.to_numpy(dtype=float), rtol=1e-9, atol=1e-6, equal_nan=True)
+        if not same:
+            diff = _first_difference(got, want)
+            failures.append(f"{name}: {label} differs from a rebuild{diff}")
+    return failures
+
+
+def _first_difference(got, want):
+    if not got.index.equals(want.index):
+        return f" (index {list(got.index.symmetric_difference(want.index))[:3]})"
+    values, expected = got.to_numpy(dtype=float), want.to_numpy(dtype=float)
+    bad = ~np.isclose(values, expected, rtol=1e-9, atol=1e-6, equal_nan=True)
+    row, column = np.argwhere(bad)[0]
+    return f" ({got.index[row]} {got.columns[column]}: {values[row, column]} != {expected[row, column]})"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--rounds', type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app = import_app(workdir, 'http://127.0.0.1:9')
+    from column_store import ColumnStore
+    from ingest import DataIngestor
+
+    windows, ranges = app.TIME_DURATIONS, app.Y_RANGES
+    rng = np.random.default_rng(args.seed)
+    frame = with_night_runs(generate_frame(args.days, seed=args.seed, outages_per_day=0.0))
+    dataset = Dataset()
+    server, url = serve_in_thread(create_app(dataset))
+
+    failures, checks, failed = [], 0, 0
+    try:
+        for name, versions in scenarios(frame, rng, args.rounds):
+            with tempfile.TemporaryDirectory() as workdir:
+                workers = [DataIngestor(url, interval=0, cache_dir=os.path.join(workdir, 'cache'),
+                                        store=ColumnStore(os.path.join(workdir, 'store')), background=False,
+                                        rolling_windows=windows, rolling_ranges=ranges) for _ in range(2)]
+                found = []
+                for served in versions:
+                    dataset.replace(to_records(served))
+                    for worker in workers:
+                        result = compare(name, worker.refresh(wait=True), served, windows, ranges)
+                        found += result
+                        checks += 1
+                        failed += bool(result)
+                print(f"{'ok' if not found else 'FAIL':<5} {name}")
+                for failure in found[:5]:
+                    print(f"      {failure}")
+                failures += found
+    finally:
+        server.shutdown()
+
+    print(f"\n{checks - failed} of {checks} published snapshots equal a full rebuild")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
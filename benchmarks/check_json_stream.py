@@ -0,0 +1,115 @@
+"""Correctness check of json_stream.iter_json_items against json.loads.
+
+Every document is fed as UTF-8 bytes cut into chunks of every size from 1
+to --max-chunk (and as one chunk), so items, numbers, literals, escapes
+and multi-byte characters all get split at every possible position. Valid
+documents must give the same items as json.loads; malformed ones must
+raise ValueError, as json.loads does. Exits with status 1 on any mismatch.
+
+Usage: python benchmarks/check_json_stream.py [--days N] [--max-chunk N]
+"""
+import argparse
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import generate_records  # noqa: E402
+
+from json_stream import iter_json_items  # noqa: E402
+
+VALID = [
+    '[]',
+    ' [ ] ',
+    '[1]',
+    '[1, 2.5, -3e-2, 0, 1E+10]',
+    '[true, false, null]',
+    '["", "a,b]", "quote \\" and \\\\", "\\u00e9\\ud83d\\ude00", "é水😀"]',
+    '[{"a": [1, {"b": null}]}, [], {}, [[]]]',
+    '\n[\t{"timestamp": "01-Jan-2024 00:00:00", "source_pH": 7.5}\r\n]\n',
+    '{"single": "object"}',
+    '[12345678901234567890, 1.7976931348623157e308]',
+]
+MALFORMED = [
+    '',
+    '[',
+    '[1',
+    '[1,',
+    '[1,]',
+    '[,1]',
+    '[1 2]',
+    '[01]',
+    '[-]',
+    '[1e]',
+    '[tru]',
+    '[nul]',
+    '["a]',
+    '[{"a": 1]',
+    '[1]x',
+    '[1] [2]',
+    '{"a": 1,}',
+]
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def expected(text):
+    value = json.loads(text)
+    return value if isinstance(value, list) else [value]
+
+
+def check(text, chunk_sizes, valid):
+    data = text.encode('utf-8')
+    failures = []
+    for size in chunk_sizes:
+        try:
+            items = list(iter_json_items(chunked(data, size)))
+        except ValueError as e:
+            if valid:
+                failures.append(f"chunk {size}: raised {e}")
+            continue
+        if not valid:
+            failures.append(f"chunk {size}: accepted, gave {items!r:.60}")
+        elif items != expected(text):
+            failures.append(f"chunk {size}: items differ from json.loads")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=1, help='days of synthetic API records to check')
+    parser.add_argument('--max-chunk', type=int, default=64)
+    args = parser.parse_args()
+
+    payload = json.dumps(generate_records(args.days))
+    cases = [(text, True) for text in VALID + [payload]] + [(text, False) for text in MALFORMED]
+    for text, valid in cases:
+        if not valid:
+            try:
+                json.loads(text)
+                raise AssertionError(f"json.loads accepts the malformed case {text!r}")
+            except ValueError:
+                pass
+
+    failed = 0
+    for text, valid in cases:
+        sizes = list(range(1, args.max_chunk + 1)) + [max(len(text.encode('utf-8')), 1)]
+        failures = check(text, sizes, valid)
+        label = f"{text[:40]!r}{'...' if len(text) > 40 else ''}"
+        print(f"{'ok' if not failures else 'FAIL':<5} {'valid' if valid else 'malformed':<10} {label}")
+        for failure in failures[:5]:
+            print(f"      {failure}")
+        failed += bool(failures)
+
+    print(f"\n{len(cases) - failed} of {len(cases)} documents behave like json.loads at every chunk size")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
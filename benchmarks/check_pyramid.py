@@ -0,0 +1,124 @@
+"""Correctness check of pyramid.AggregatePyramid against pandas resample.
+
+Synthetic readings with outages, missing values and jittered timestamps are
+fed to AggregatePyramid in batches of random size, as ingestion does. After
+some batches every level (hour, day, week from Monday) is compared with
+pandas `resample` count/sum/min/max over the rows so far, dropping buckets
+without rows as the pyramid does. A fresh instance synced to the same prefix
+checks the bulk load path, and recompute_since() is checked after the
+readings from a random point on are corrected. Exits with status 1 on any
+mismatch.
+
+Usage: python benchmarks/check_pyramid.py [--days N] [--seed N] [--checkpoints N]
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import generate_frame, to_records  # noqa: E402
+
+from data_process import process_data  # noqa: E402
+from pyramid import AGGREGATES, LEVELS, AggregatePyramid  # noqa: E402
+
+RULES = {'hour': '1h', 'day': '1D', 'week': 'W-MON'}
+
+
+def pandas_levels(df, parameters):
+    # {level: frame of <param>_<agg> by bucket start}, like AggregatePyramid.levels
+    values = df.set_index('timestamp')[parameters].astype(float)
+    levels = {}
+    for name in LEVELS:
+        resampled = values.resample(RULES[name], closed='left', label='left')
+        rows = resampled.size()
+        columns = {}
+        for param in parameters:
+            for agg in AGGREGATES:
+                columns[f'{param}_{agg}'] = getattr(resampled[param], agg)()
+        table = pd.DataFrame(columns)[rows > 0]
+        table.index = pd.DatetimeIndex(table.index, name='timestamp')
+        levels[name] = table
+    return levels
+
+
+def compare(label, levels, expected):
+    failures = []
+    for name, want in expected.items():
+        got = levels[name]
+        if not got.index.equals(want.index):
+            failures.append(f"{label}: {name} buckets differ ({len(got)} vs pandas {len(want)})")
+            continue
+        got, want = got[want.columns].to_numpy(dtype=float), want.to_numpy(dtype=float)
+        bad = ~np.isclose(got, want, rtol=1e-9, atol=1e-6, equal_nan=True)
+        if bad.any():
+            row, column = np.argwhere(bad)[0]
+            failures.append(f"{label}: {name} row {row} column {column}: {got[row, column]} != "
+                            f"pandas {want[row, column]}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=5)
+    parser.add_argument('--checkpoints', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    frame = generate_frame(args.days, seed=args.seed, outages_per_day=0.5, missing_rate=0.05)
+    frame['timestamp'] += pd.to_timedelta(rng.integers(0, 300, size=len(frame)), unit='s')
+    df = process_data(to_records(frame))
+    pyramid = AggregatePyramid()
+    parameters = pyramid.parameters
+
+    batches = np.cumsum(rng.integers(1, 400, size=len(df)))
+    batches = np.append(batches[batches < len(df)], len(df))
+    checkpoints = set(rng.choice(len(batches) - 1, size=min(args.checkpoints, len(batches) - 1),
+                                 replace=False).tolist()) | {len(batches) - 1}
+
+    failures, checks, failed, start = [], 0, 0, 0
+    for i, stop in enumerate(batches.tolist()):
+        pyramid.update(df.iloc[start:stop])
+        start = stop
+        if i not in checkpoints:
+            continue
+        expected = pandas_levels(df.iloc[:stop], parameters)
+        # The same prefix loaded in one go (the rebuild path)
+        loaded = AggregatePyramid()
+        loaded.sync(df.iloc[:stop], generation=1)
+        for result in (compare(f"update to row {stop}", pyramid.levels, expected),
+                       compare(f"sync of {stop} rows", loaded.levels, expected)):
+            failures += result
+            failed += bool(result)
+            checks += 1
+
+    # Readings corrected from a random point on, as a backfill does, then only the affected buckets redone
+    for _ in range(args.checkpoints):
+        cut = int(rng.integers(0, len(df)))
+        corrected = df.copy()
+        corrected.loc[corrected.index[cut:], parameters[0]] += 1.0
+        since = corrected['timestamp'].iloc[cut]
+        redone = AggregatePyramid()
+        redone.sync(df, generation=1)
+        redone.recompute_since(corrected, since)
+        result = compare(f"recompute_since row {cut}", redone.levels, pandas_levels(corrected, parameters))
+        failures += result
+        failed += bool(result)
+        checks += 1
+
+    for failure in failures[:20]:
+        print(failure)
+    print(f"{checks - failed} of {checks} pyramids match pandas resample "
+          f"({len(df)} rows, {len(checkpoints)} checkpoints)")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
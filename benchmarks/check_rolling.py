@@ -0,0 +1,123 @@
+"""Correctness check of rolling.RollingStats against pandas.
+
+Synthetic readings with outages, missing values and jittered timestamps
+(so window edges fall inside a sample's span, not on a sample) are fed to
+RollingStats in batches of random size, as ingestion does. After some batches every
+window of the dashboard's TIME_DURATIONS is compared with pandas
+`rolling(duration, closed='both')` (count, mean, std, min, max), and the
+measured and outside-range seconds with a direct sum over the samples'
+spans. A fresh instance synced to the same prefix checks the bulk load
+path too. Exits with status 1 on any mismatch.
+
+Usage: python benchmarks/check_rolling.py [--days N] [--seed N] [--checkpoints N]
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from run_benchmarks import import_app  # noqa: E402
+from synthetic import generate_frame, to_records  # noqa: E402
+
+STATS = ['count', 'mean', 'std', 'min', 'max']
+
+
+def pandas_rolling(df, windows, parameters):
+    # {(window, parameter): frame of STATS at every sample}, over widened float32 values
+    from data_process import widen_float32
+
+    expected = {}
+    for label, duration in windows.items():
+        for param in parameters:
+            series = pd.Series(widen_float32(df[param].to_numpy()), index=df['timestamp'])
+            rolling = series.rolling(duration, closed='both')
+            expected[(label, param)] = pd.DataFrame({'count': rolling.count(), 'mean': rolling.mean(),
+                                                     'std': rolling.std(), 'min': rolling.min(),
+                                                     'max': rolling.max()}).to_numpy()
+    return expected
+
+
+def span_seconds(df, end, duration, param, bounds, max_span):
+    # Measured and outside-range seconds of [end - duration, end], summed span by span
+    from data_process import widen_float32
+
+    timestamps = df['timestamp'].to_numpy().astype(np.int64)[:end + 1]
+    values = widen_float32(df[param].to_numpy())[:end + 1]
+    cutoff = timestamps[-1] - pd.Timedelta(duration).value
+    starts = np.maximum(timestamps[:-1], cutoff)
+    ends = np.minimum(timestamps[1:], timestamps[:-1] + pd.Timedelta(max_span).value)
+    lengths = np.clip(ends - starts, 0, None)
+    measured = ~np.isnan(values[:-1])
+    outside = measured & ((values[:-1] < bounds[0]) | (values[:-1] > bounds[1]))
+    return lengths[measured].sum() / 1e9, lengths[outside].sum() / 1e9
+
+
+def compare(table, df, end, expected, windows, ranges, max_span):
+    failures = []
+    for (label, param), values in expected.items():
+        row = table.loc[(label, param)]
+        got = row[STATS].to_numpy(dtype=float)
+        want = values[end]
+        if not np.allclose(got, want, rtol=1e-6, atol=1e-9, equal_nan=True):
+            failures.append(f"{label} {param} at row {end}: {got.tolist()} != pandas {want.tolist()}")
+        measured, outside = span_seconds(df, end, windows[label], param, ranges[param], max_span)
+        if abs(row['measured_seconds'] - measured) > 1e-6 or abs(row['outside_seconds'] - outside) > 1e-6:
+            failures.append(f"{label} {param} at row {end}: seconds {row['measured_seconds']}, "
+                            f"{row['outside_seconds']} != {measured}, {outside}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=3)
+    parser.add_argument('--checkpoints', type=int, default=40)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app = import_app(workdir, 'http://127.0.0.1:9')
+    from data_process import process_data
+    from rolling import MAX_SAMPLE_SPAN, RollingStats
+
+    windows, ranges = app.TIME_DURATIONS, app.Y_RANGES
+    rng = np.random.default_rng(args.seed)
+    frame = generate_frame(args.days, seed=args.seed, outages_per_day=0.5, missing_rate=0.05)
+    # Up to 5 minutes late on a 10 minute cadence: the order stays, the regular grid does not
+    frame['timestamp'] += pd.to_timedelta(rng.integers(0, 300, size=len(frame)), unit='s')
+    df = process_data(to_records(frame))
+    stats = RollingStats(windows, ranges)
+    expected = pandas_rolling(df, windows, stats.parameters)
+
+    batches = np.cumsum(rng.integers(1, 40, size=len(df)))
+    batches = np.append(batches[batches < len(df)], len(df))
+    checkpoints = set(rng.choice(len(batches) - 1, size=min(args.checkpoints, len(batches) - 1),
+                                 replace=False).tolist()) | {len(batches) - 1}
+
+    failures, checks, start = [], 0, 0
+    for i, stop in enumerate(batches.tolist()):
+        stats.update(df.iloc[start:stop])
+        start = stop
+        if i not in checkpoints:
+            continue
+        failures += compare(stats.table, df, stop - 1, expected, windows, ranges, MAX_SAMPLE_SPAN)
+        # The same prefix loaded in one go (the rebuild path)
+        loaded = RollingStats(windows, ranges)
+        loaded.sync(df.iloc[:stop], generation=1)
+        failures += compare(loaded.table, df, stop - 1, expected, windows, ranges, MAX_SAMPLE_SPAN)
+        checks += 2 * len(expected)
+
+    for failure in failures[:20]:
+        print(failure)
+    print(f"{checks - len(failures)} of {checks} window/parameter checks match pandas "
+          f"({len(df)} rows, {len(checkpoints)} checkpoints)")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
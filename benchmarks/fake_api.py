@@ -0,0 +1,150 @@
+"""Local stand-in for the sensor API, serving synthetic records.
+
+Implements POST /get_token and GET <data path> (default /suman_nagar_data)
+like the live API: bearer tokens with an expiry and the '%d-%b-%Y %H:%M:%S'
+timestamp format. The `since` parameter is honoured, and responses are
+gzip-compressed for clients that accept it (unless --no-gzip). GET /stats
+counts the requests and the bytes sent.
+
+Usage: python benchmarks/fake_api.py [--port 5055] [--days 30] [--latency 0] [--no-gzip]
+                                     [--live SECONDS] [--data-path /suman_nagar_data]
+
+With --live a new reading is appended every SECONDS seconds, continuing the
+10-minute cadence, so the dashboard sees data arrive.
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import secrets
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from flask import Flask, Response, jsonify, request
+from werkzeug.serving import make_server
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import CADENCE, TIMESTAMP_FORMAT, generate_frame, to_records  # noqa: E402
+
+TOKEN_TTL = 30 * 60
+
+
+class Dataset:
+    """Records pre-encoded as JSON, with their timestamps for `since` lookups."""
+
+    def __init__(self, records=()):
+        self._lock = threading.Lock()
+        self.replace(records)
+
+    def replace(self, records):
+        timestamps = pd.to_datetime([r['timestamp'] for r in records], format=TIMESTAMP_FORMAT).to_numpy()
+        encoded = [json.dumps(r) for r in records]
+        with self._lock:
+            self._timestamps = timestamps
+            self._encoded = encoded
+
+    def append(self, records):
+        timestamps = pd.to_datetime([r['timestamp'] for r in records], format=TIMESTAMP_FORMAT).to_numpy()
+        with self._lock:
+            self._timestamps = np.concatenate([self._timestamps, timestamps])
+            self._encoded.extend(json.dumps(r) for r in records)
+
+    def last_timestamp(self):
+        with self._lock:
+            return pd.Timestamp(self._timestamps[-1]) if len(self._timestamps) else None
+
+    def body(self, since=None):
+        with self._lock:
+            start = 0
+            if since is not None:
+                start = int(np.searchsorted(self._timestamps, np.datetime64(since, 'ns'), side='right'))
+            return '[' + ','.join(self._encoded[start:]) + ']'
+
+
+def create_app(dataset, data_path='/suman_nagar_data', latency=0.0, token_ttl=TOKEN_TTL, compress=True):
+    app = Flask(__name__)
+    tokens = {}
+    stats = {'token': 0, 'data': 0, 'bytes': 0}
+
+    @app.post('/get_token')
+    def get_token():
+        stats['token'] += 1
+        body = request.get_json(silent=True) or {}
+        if not body.get('username') or not body.get('password'):
+            return jsonify(error='username and password are required'), 401
+        token = secrets.token_hex(16)
+        tokens[token] = time.time() + token_ttl
+        return jsonify(token=token, expires_in=token_ttl)
+
+    @app.get(data_path)
+    def get_data():
+        stats['data'] += 1
+        token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if tokens.get(token, 0) < time.time():
+            return jsonify(error='invalid or expired token'), 401
+        if latency:
+            time.sleep(latency)
+        since = request.args.get('since')
+        body = dataset.body(pd.to_datetime(since, format=TIMESTAMP_FORMAT) if since else None).encode()
+        headers = {}
+        if compress and 'gzip' in request.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body, compresslevel=6)
+            headers['Content-Encoding'] = 'gzip'
+        stats['bytes'] += len(body)
+        return Response(body, mimetype='application/json', headers=headers)
+
+    @app.get('/stats')
+    def get_stats():
+        return jsonify(stats)
+
+    return app
+
+
+def serve_in_thread(app, host='127.0.0.1', port=0):
+    # Returns (server, base_url); stop it with server.shutdown()
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server(host, port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='fake-api', daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+def keep_appending(dataset, every, seed=1):
+    # One new reading every `every` seconds, 10 minutes after the previous one
+    index = 0
+    while True:
+        time.sleep(every)
+        last = dataset.last_timestamp()
+        frame = generate_frame(1, start=last + CADENCE, seed=seed + index, outages_per_day=0).iloc[:1]
+        record = to_records(frame)[0]
+        record['_id'] = f'live{index:020x}'
+        dataset.append([record])
+        index += 1
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every data request')
+    parser.add_argument('--live', type=float, default=0.0, help='append a reading every N seconds')
+    parser.add_argument('--data-path', default='/suman_nagar_data')
+    parser.add_argument('--no-gzip', action='store_true', help='always send uncompressed responses')
+    args = parser.parse_args()
+
+    # End the history now, so the dashboard's "today" and "last 3 hours" have data
+    start = (pd.Timestamp.now().floor('10min') - args.days * pd.Timedelta(days=1)).to_pydatetime()
+    dataset = Dataset(to_records(generate_frame(args.days, start=start)))
+    if args.live:
+        threading.Thread(target=keep_appending, args=(dataset, args.live), daemon=True).start()
+    app = create_app(dataset, args.data_path, args.latency, compress=not args.no_gzip)
+    print(f"Serving {args.days} days of synthetic data on http://127.0.0.1:{args.port}{args.data_path}")
+    app.run(port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+"""Offline benchmark harness: data processing, callbacks and map creation across data sizes.
+
+Everything runs against synthetic data served by a local stand-in API
+(benchmarks/fake_api.py), with stores, caches and metrics in a temporary
+directory, so runs are reproducible without network access.
+
+Usage: python benchmarks/run_benchmarks.py [days ...] [--repeat N] [--output FILE]
+                                           [--compare BASELINE] [--threshold RATIO]
+
+Results are written as JSON (default benchmarks/results/<time>.json). With
+--compare the run is checked against an earlier results file; the exit
+status is 1 when any benchmark got slower by more than --threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_api import Dataset, create_app, serve_in_thread  # noqa: E402
+from synthetic import generate_frame, to_records  # noqa: E402
+
+SITE_SLUG = 'suman_nagar'
+
+
+def timed(func, *args, repeat=3):
+    # Best of `repeat` runs, in seconds
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def triggered_by(prop_id, callback, *args):
+    # Calls a callback that reads dash.ctx as if `prop_id` (e.g. 'table.page_current') had changed
+    from contextvars import copy_context
+
+    from dash._callback_context import context_value
+    from dash._utils import AttributeDict
+
+    def run():
+        context_value.set(AttributeDict(triggered_inputs=[{'prop_id': prop_id, 'value': None}]))
+        return callback(*args)
+    return copy_context().run(run)
+
+
+def write_sites_file(path, api_url):
+    with open(os.path.join(ROOT, 'sites.json')) as f:
+        site = json.load(f)[0]
+    site.update(slug=SITE_SLUG, api_url=api_url, data_path='/suman_nagar_data', min_request_interval=0.0)
+    # Relative input paths in sites.json are relative to the repository
+    for key in ('excel_path', 'geojson_path'):
+        site[key] = os.path.join(ROOT, site[key])
+    with open(path, 'w') as f:
+        json.dump([site], f)
+
+
+def import_app(workdir, api_url):
+    # main reads its configuration from the environment at import time
+    sites_file = os.path.join(workdir, 'sites.json')
+    write_sites_file(sites_file, api_url)
+    os.environ.update({
+        'SITES_FILE': sites_file,
+        'DATA_STORE_DIR': os.path.join(workdir, 'store'),
+        'DATA_CACHE_DIR': os.path.join(workdir, 'cache'),
+        'METRICS_DIR': os.path.join(workdir, 'metrics'),
+        'MAP_DIR': os.path.join(workdir, 'maps'),
+    })
+    os.chdir(ROOT)
+    import main
+    return main
+
+
+def bench_size(main, dataset, days, repeat, workdir):
+    from data_process import process_data
+    from ingest import SiteIngestors
+    from rolling import RollingStats
+
+    start = (pd.Timestamp.now().floor('10min') - days * pd.Timedelta(days=1)).to_pydatetime()
+    records = to_records(generate_frame(days, start=start))
+    dataset.replace(records)
+    results = {'rows': len(records)}
+
+    results['process_data'] = timed(process_data, records, repeat=repeat)
+    frame = process_data(records)
+    results['calculate_pumping_time_and_flow'] = timed(main.calculate_pumping_time_and_flow, frame, repeat=repeat)
+    # Cold start of the rolling statistics; later samples only cost an update each
+    rolling = RollingStats(main.TIME_DURATIONS, main.Y_RANGES)
+    results['rolling_stats_rebuild'] = timed(rolling.rebuild, frame, repeat=repeat)
+
+    # Cold ingest: token, full fetch, processing and the first append to an empty store
+    ingestors = SiteIngestors(main.SITES.values(), cache_dir=os.path.join(workdir, f'cache-{days}'),
+                              store_dir=os.path.join(workdir, f'store-{days}'), background=False,
+                              rolling_windows=main.TIME_DURATIONS, rolling_ranges=main.Y_RANGES)
+    start_time = time.perf_counter()
+    ingestors.refresh_all(wait_for_lock=True)
+    results['ingest_cold'] = time.perf_counter() - start_time
+    main.ingestors = ingestors
+
+    def incremental_refresh():
+        # Nothing new upstream: a `since` request and an empty append
+        ingestors[SITE_SLUG]._snapshot = ingestors[SITE_SLUG]._snapshot._replace(updated_at=0.0)
+        os.utime(ingestors[SITE_SLUG].heartbeat_path, (0, 0))
+        ingestors[SITE_SLUG].refresh(wait=True)
+
+    results['ingest_incremental'] = timed(incremental_refresh, repeat=repeat)
+
+    pathname = '/dashboard/'
+    selected_range = main.fetch_historical_data(1, pathname, '2000-01-01', '2100-01-01')
+    # What a browser that already holds the live window sends back
+    cursor = main.update_dashboard(0, None, pathname, None)[-1]
+    callbacks = {
+        'update_dashboard': lambda: main.update_dashboard(0, None, pathname, None),
+        'update_dashboard_unchanged': lambda: main.update_dashboard(0, None, pathname, cursor),
+        'update_additional_metrics': lambda: main.update_additional_metrics(0, None, pathname),
+        'update_rolling_stats': lambda: main.update_rolling_stats(0, None, pathname, '1 Week'),
+        'update_history_window': lambda: main.update_history_window(selected_range, 'source_TDS'),
+        'update_table': lambda: triggered_by('historical-data-table.page_current', main.update_table,
+                                             selected_range, 0, 10, [], ''),
+        'update_table_sorted_filtered': lambda: triggered_by(
+            'historical-data-table.sort_by', main.update_table,
+            selected_range, 3, 10, [{'column_id': 'source_TDS', 'direction': 'desc'}], '{source_flow} > 0'),
+    }
+    for name, callback in callbacks.items():
+        results[f'callback.{name}'] = timed(callback, repeat=repeat)
+
+    client = main.server.test_client()
+
+    def export_csv():
+        response = client.get(f'/export/historical?site={SITE_SLUG}&start_date=2000-01-01&end_date=2100-01-01')
+        for _ in response.response:
+            pass
+        response.close()
+
+    results['export_csv'] = timed(export_csv, repeat=repeat)
+    return results
+
+
+def bench_map(main, repeat):
+    from map_builder import create_map, load_excel_data, load_geojson
+    from spatial import spatial_index
+
+    site = main.SITES[SITE_SLUG]
+
+    def build_cold():
+        load_geojson.cache_clear()
+        load_excel_data.cache_clear()
+        create_map(site).get_root().render()
+
+    index = spatial_index(site)
+    bbox = tuple(load_excel_data(site.excel_path, site.excel_sheet).total_bounds)
+
+    def features_cold():
+        index._cached.cache_clear()
+        for layer in ('samples', 'boundaries'):
+            index.features(layer, bbox, 14)
+
+    return {'create_map_cold': timed(build_cold, repeat=repeat),
+            'create_map_warm': timed(lambda: create_map(site).get_root().render(), repeat=repeat),
+            'geo_features_cold': timed(features_cold, repeat=repeat),
+            'geo_lookup': timed(lambda: index.lookup((bbox[0] + bbox[2]) / 2, (bbox[1] + bbox[3]) / 2),
+                                repeat=repeat)}
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+    }
+
+
+def flatten(results):
+    # {(benchmark, days): seconds}; map benchmarks do not depend on the data size
+    flat = {}
+    for days, entries in results['sizes'].items():
+        for name, value in entries.items():
+            if name != 'rows':
+                flat[(name, days)] = value
+    for name, value in results['map'].items():
+        flat[(name, '-')] = value
+    return flat
+
+
+def compare(current, baseline, threshold):
+    old, new = flatten(baseline), flatten(current)
+    regressions = []
+    print(f"\n{'benchmark':<36} {'days':>6} {'baseline (s)':>13} {'current (s)':>12} {'ratio':>7}")
+    for key in sorted(new, key=lambda k: (k[0], int(k[1]) if k[1] != '-' else 0)):
+        if key not in old:
+            continue
+        ratio = new[key] / old[key] if old[key] else float('inf')
+        flag = '  <-- slower' if ratio > threshold else ''
+        if flag:
+            regressions.append(key)
+        print(f"{key[0]:<36} {key[1]:>6} {old[key]:>13.5f} {new[key]:>12.5f} {ratio:>6.2f}x{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('days', nargs='*', type=int, default=[7, 30, 365, 3 * 365])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='slowdown ratio that counts as a regression')
+    args = parser.parse_args()
+
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results',
+                                         f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    dataset = Dataset()
+    server, api_url = serve_in_thread(create_app(dataset))
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            app = import_app(workdir, api_url)
+            results = {'environment': environment(), 'sizes': {}, 'map': bench_map(app, args.repeat)}
+            print(f"{'benchmark':<36} {'days':>6} {'rows':>8} {'seconds':>10}")
+            for name, seconds in results['map'].items():
+                print(f"{name:<36} {'-':>6} {'-':>8} {seconds:>10.5f}")
+            for days in args.days:
+                sizes = bench_size(app, dataset, days, args.repeat, workdir)
+                results['sizes'][str(days)] = sizes
+                for name, seconds in sizes.items():
+                    if name != 'rows':
+                        print(f"{name:<36} {days:>6} {sizes['rows']:>8} {seconds:>10.5f}")
+    finally:
+        server.shutdown()
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) slower than {args.threshold}x the baseline")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
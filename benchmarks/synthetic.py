@@ -0,0 +1,81 @@
+"""Synthetic Suman Nagar sensor streams, shaped like the records the sensor API returns.
+
+One record every 10 minutes with:
+- two scheduled pump runs a day (around 06:00 and 18:00, of random length) and
+  the odd short midday run; flow and pressure only while pumping
+- pH around 7.6 with a small daily cycle and noise
+- TDS drifting slowly around 300 ppm
+- FRC that rises a little while the pump (and dosing) runs
+- sensor outages that drop whole hours of records, and single missing readings
+
+Usage: python benchmarks/synthetic.py DAYS > records.json
+"""
+import json
+import sys
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+TIMESTAMP_FORMAT = '%d-%b-%Y %H:%M:%S'
+CADENCE = pd.Timedelta(minutes=10)
+PARAMETERS = ['source_pH', 'source_TDS', 'source_FRC', 'source_pressure', 'source_flow']
+
+
+def generate_frame(days, start=datetime(2024, 1, 1), seed=0, outages_per_day=0.05, missing_rate=0.002):
+    """The stream as a frame: datetime64 timestamps, float readings (NaN when missing)."""
+    rng = np.random.default_rng(seed)
+    timestamps = pd.date_range(start, periods=days * 144, freq=CADENCE)
+    n = len(timestamps)
+    minute = np.asarray(timestamps.hour * 60 + timestamps.minute)
+    day = np.asarray((timestamps - timestamps[0].normalize()).days)
+    # Calendar days covered; one more than `days` unless the stream starts at midnight
+    n_days = int(day[-1]) + 1 if n else 0
+
+    pumping = np.zeros(n, dtype=bool)
+    for start_minute, length in ((360, (60, 180)), (1080, (60, 180)), (780, (20, 50))):
+        starts = start_minute + rng.integers(-30, 31, n_days)
+        lengths = rng.integers(*length, n_days)
+        if start_minute == 780:
+            # The midday run only happens on some days
+            lengths[rng.random(n_days) > 0.2] = 0
+        pumping |= (minute >= starts[day]) & (minute < starts[day] + lengths[day])
+
+    flow = np.where(pumping, rng.normal(5.0, 0.3, n).clip(3.5, 6.5), 0.0)
+    pressure = np.where(pumping, rng.normal(1.0, 0.08, n), rng.uniform(0, 0.03, n)).clip(0, 2)
+    ph = 7.6 + 0.1 * np.sin(2 * np.pi * minute / 1440) + rng.normal(0, 0.05, n)
+    tds = 300 + np.cumsum(rng.normal(0, 0.2, n)).clip(-40, 40) + rng.normal(0, 3, n)
+    frc = np.where(pumping, rng.normal(0.035, 0.005, n), rng.normal(0.02, 0.003, n)).clip(0, 0.05)
+
+    df = pd.DataFrame({
+        'timestamp': timestamps,
+        'source_pH': ph.round(2),
+        'source_TDS': tds.round(1),
+        'source_FRC': frc.round(3),
+        'source_pressure': pressure.round(2),
+        'source_flow': flow.round(2),
+    })
+    for col in PARAMETERS:
+        df.loc[rng.random(n) < missing_rate, col] = np.nan
+
+    # Outages: whole blocks of records never reach the API
+    keep = np.ones(n, dtype=bool)
+    for outage_start in np.flatnonzero(rng.random(n) < outages_per_day / 144):
+        keep[outage_start:outage_start + rng.integers(6, 72)] = False
+    return df[keep].reset_index(drop=True)
+
+
+def to_records(df):
+    # API-shaped dicts: a Mongo-style id, the formatted timestamp, None for missing readings
+    ids = [f'{i:024x}' for i in range(len(df))]
+    timestamps = df['timestamp'].dt.strftime(TIMESTAMP_FORMAT).tolist()
+    columns = [df[col].astype(object).where(df[col].notna(), None).tolist() for col in PARAMETERS]
+    return [dict(zip(['_id', 'timestamp'] + PARAMETERS, row)) for row in zip(ids, timestamps, *columns)]
+
+
+def generate_records(days, **options):
+    return to_records(generate_frame(days, **options))
+
+
+if __name__ == '__main__':
+    json.dump(generate_records(int(sys.argv[1]) if len(sys.argv) > 1 else 7), sys.stdout)
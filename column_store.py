@@ -0,0 +1,276 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_process import REQUIRED_COLUMNS
+
+STORE_DIR = os.environ.get('DATA_STORE_DIR', 'sensor_store')
+# Backfills remembered in the manifest for readers that have to catch up (see late_since)
+LATE_LOG_SIZE = 32
+
+
+class ColumnStore:
+    """Persistent, append-only sensor history kept as raw memory-mapped NumPy columns.
+
+    Layout on disk::
+
+        <path>/manifest.json      row count, column dtypes, version, generation, backfill log
+        <path>/<directory>/c<i>.bin
+
+    Rows newer than the high-water mark are appended to the column files in
+    place and the manifest is then swapped atomically, so readers in other
+    processes only ever map complete rows. Late rows that are new or differ
+    from what is stored are merged by backfill(): the columns are rewritten
+    to a new directory, but the generation stays and the affected days are
+    logged, so readers can redo just those (late_since). Only replace()
+    starts a new generation. process_and_store_data() feeds it.
+    """
+
+    def __init__(self, path=STORE_DIR):
+        self.path = path
+        self.manifest_path = os.path.join(path, 'manifest.json')
+        self._manifest = None
+        self._manifest_key = None
+        self._frame = pd.DataFrame()
+        self._lock = threading.Lock()
+        self.last_update_seconds = 0.0
+        self.last_update_rows = 0
+
+    @property
+    def version(self):
+        self.refresh()
+        return self._manifest['version'] if self._manifest else 0
+
+    @property
+    def generation(self):
+        self.refresh()
+        return self._manifest['generation'] if self._manifest else 0
+
+    @property
+    def last_backfill(self):
+        # Store version of the latest backfill in this generation, 0 if there was none
+        self.refresh()
+        log = self._manifest.get('late', []) if self._manifest else []
+        return log[-1][0] if log else 0
+
+    @property
+    def size(self):
+        self.refresh()
+        return self._manifest['rows'] if self._manifest else 0
+
+    @property
+    def high_water_mark(self):
+        frame = self.frame()
+        if frame.empty:
+            return None
+        return frame['timestamp'].iloc[-1]
+
+    def frame(self):
+        self.refresh()
+        return self._frame
+
+    def refresh(self):
+        # Re-map the columns when the manifest was replaced (by us or another worker)
+        try:
+            st = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return False
+        key = (st.st_ino, st.st_mtime_ns)
+        if key == self._manifest_key:
+            return False
+        with self._lock:
+            if key == self._manifest_key:
+                return False
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+            self._frame = self._open(manifest)
+            self._manifest = manifest
+            self._manifest_key = key
+        return True
+
+    def _open(self, manifest):
+        rows = manifest['rows']
+        columns = {}
+        for i, (name, dtype) in enumerate(manifest['columns']):
+            if rows:
+                columns[name] = np.memmap(self._column_path(manifest, i), dtype=dtype,
+                                          mode='r', shape=(rows,))
+            else:
+                columns[name] = np.empty(0, dtype=dtype)
+        return pd.DataFrame(columns, copy=False)
+
+    def append(self, new_data):
+        start = time.perf_counter()
+        added = self._append(new_data)
+        self.last_update_seconds = time.perf_counter() - start
+        self.last_update_rows = added
+        return added
+
+    def _append(self, new_data):
+        if new_data.empty:
+            return 0
+        new_data = _storable(new_data)
+        if not new_data['timestamp'].is_monotonic_increasing:
+            new_data = new_data.sort_values('timestamp', kind='stable')
+        if new_data['timestamp'].duplicated().any():
+            new_data = new_data.drop_duplicates(subset='timestamp', keep='last')
+        hwm = self.high_water_mark
+        split = 0 if hwm is None else int(np.searchsorted(new_data['timestamp'].to_numpy(), np.datetime64(hwm),
+                                                          side='right'))
+        if split:
+            late = self._changed(new_data.iloc[:split])
+            if not late.empty:
+                return self.backfill(pd.concat([late, new_data.iloc[split:]]))
+            new_data = new_data.iloc[split:]
+        if new_data.empty:
+            return 0
+
+        manifest = self._manifest
+        if manifest is None:
+            self.replace(new_data)
+            return len(new_data)
+
+        # The batch is aligned to the stored columns: fields it lacks are stored as missing, and a
+        # field the store has not seen yet gets a new column file that is missing for the earlier
+        # rows. Existing files are only ever appended to, so the generation stays the same.
+        rows = manifest['rows']
+        known = [name for name, _ in manifest['columns']]
+        columns = manifest['columns'] + [[name, new_data[name].to_numpy().dtype.str]
+                                         for name in new_data.columns if name not in known]
+        for i, (name, dtype) in enumerate(columns):
+            values = new_data[name].to_numpy(dtype=dtype) if name in new_data else _missing(dtype, len(new_data))
+            path = self._column_path(manifest, i)
+            with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+                if i >= len(known):
+                    f.write(_missing(dtype, rows).tobytes())
+                # Seek instead of appending so bytes left by an interrupted write get overwritten
+                f.seek(rows * values.itemsize)
+                f.write(values.tobytes())
+                f.truncate()
+        self._write_manifest(dict(manifest, rows=rows + len(new_data), columns=columns,
+                                  version=manifest['version'] + 1, updated_at=time.time()))
+        return len(new_data)
+
+    def backfill(self, records):
+        # Merge records that are not newer than the high-water mark (late or corrected data)
+        if records.empty:
+            return 0
+        self.refresh()
+        old = self._manifest
+        if old is None:
+            self.replace(records)
+            return len(records)
+        records = _storable(records)
+        timestamps = records['timestamp']
+        late = timestamps[timestamps <= self._frame['timestamp'].iloc[-1]] if len(self._frame) else timestamps
+        version = old['version'] + 1
+        log = old.get('late', [])
+        if not late.empty:
+            days = sorted(late.dt.normalize().unique())
+            log = log + [[version, late.min().isoformat(), [day.isoformat() for day in days]]]
+        late_from = old.get('late_from', 0)
+        if len(log) > LATE_LOG_SIZE:
+            # Readers older than the oldest entry left have to rebuild
+            late_from = log[-LATE_LOG_SIZE - 1][0]
+            log = log[-LATE_LOG_SIZE:]
+        self._rewrite(pd.concat([self._frame, records], ignore_index=True), old['generation'],
+                      f"g{old['generation']}.{version}", version, late=log, late_from=late_from)
+        return len(records)
+
+    def late_since(self, version):
+        """Earliest timestamp and the days of the rows backfilled after store version `version`.
+
+        (None, []) when nothing was backfilled since, (None, None) when the log
+        no longer reaches back that far and everything derived from the
+        store has to be rebuilt. Only meaningful within one generation.
+        """
+        self.refresh()
+        manifest = self._manifest or {}
+        if version < manifest.get('late_from', 0):
+            return None, None
+        entries = [entry for entry in manifest.get('late', []) if entry[0] > version]
+        if not entries:
+            return None, []
+        start = min(pd.Timestamp(entry[1]) for entry in entries)
+        return start, sorted({pd.Timestamp(day) for entry in entries for day in entry[2]})
+
+    def replace(self, df):
+        self.refresh()
+        old = self._manifest
+        generation = old['generation'] + 1 if old else 1
+        version = old['version'] + 1 if old else 1
+        self._rewrite(df, generation, f'g{generation}', version, late=[], late_from=version)
+
+    def _rewrite(self, df, generation, directory, version, **manifest):
+        df = _storable(df)
+        df = df.drop_duplicates(subset='timestamp', keep='last').sort_values('timestamp', kind='stable')
+        os.makedirs(os.path.join(self.path, directory), exist_ok=True)
+        columns = []
+        for i, name in enumerate(df.columns):
+            values = df[name].to_numpy()
+            values.tofile(os.path.join(self.path, directory, f'c{i}.bin'))
+            columns.append([name, values.dtype.str])
+        self._write_manifest(dict(manifest, version=version, generation=generation, directory=directory,
+                                  rows=len(df), columns=columns, updated_at=time.time()))
+        # Mapped files stay readable for processes that still hold them after unlinking
+        for entry in os.listdir(self.path):
+            if entry.startswith('g') and entry != directory:
+                shutil.rmtree(os.path.join(self.path, entry), ignore_errors=True)
+
+    def _changed(self, rows):
+        # The late rows that are not stored yet or differ from what is; a re-sent overlap is no change
+        stored = self._frame['timestamp'].to_numpy()
+        timestamps = rows['timestamp'].to_numpy()
+        position = np.searchsorted(stored, timestamps).clip(max=len(stored) - 1)
+        changed = stored[position] != timestamps
+        for name in rows.columns:
+            if name == 'timestamp':
+                continue
+            if name not in self._frame:
+                changed |= rows[name].notna().to_numpy()
+                continue
+            old = self._frame[name].to_numpy()[position]
+            new = rows[name].to_numpy(dtype=old.dtype)
+            changed |= ~((old == new) | (pd.isna(old) & pd.isna(new)))
+        return rows[changed]
+
+    def _write_manifest(self, manifest):
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+        self.refresh()
+
+    def _column_path(self, manifest, index):
+        # Stores written before backfills kept their own directory have one per generation
+        directory = manifest.get('directory', f"g{manifest['generation']}")
+        return os.path.join(self.path, directory, f'c{index}.bin')
+
+
+def _storable(df):
+    # Keep the timestamp and numeric columns; free-text fields (ids etc.) are not persisted
+    columns = {}
+    for col in df.columns:
+        series = df[col]
+        if col == 'timestamp':
+            columns[col] = pd.to_datetime(series)
+        elif pd.api.types.is_bool_dtype(series) or pd.api.types.is_integer_dtype(series):
+            # As float, so that rows without the field can be stored as NaN
+            columns[col] = series.astype(np.float64)
+        elif pd.api.types.is_numeric_dtype(series) or pd.api.types.is_datetime64_any_dtype(series):
+            columns[col] = series
+        elif col in REQUIRED_COLUMNS:
+            columns[col] = pd.to_numeric(series, errors='coerce')
+    out = pd.DataFrame(columns)
+    return out[out['timestamp'].notna()]
+
+
+def _missing(dtype, n):
+    dtype = np.dtype(dtype)
+    return np.full(n, np.datetime64('NaT') if dtype.kind == 'M' else np.nan, dtype=dtype)
@@ -1,10 +1,30 @@
-import requests
+import os
+
+import numpy as np
 import pandas as pd
-from datetime import datetime, time
-from get_data import fetch_data_from_api
+from datetime import datetime
+
+import metrics
+from get_data import fetch_records_from_api
+from timeseries import TimeSeries
 
-# Global variable to store the data
-data_store = pd.DataFrame()
+# Explicit schema for the sensor payload. Measurements are float32 (plenty for
+# sensor precision at half the memory), the timestamp is parsed once into
+# datetime64, and any other text field becomes a categorical.
+TIMESTAMP_FORMAT = '%d-%b-%Y %H:%M:%S'
+SENSOR_SCHEMA = {
+    'source_pH': np.float32,
+    'source_TDS': np.float32,
+    'source_FRC': np.float32,
+    'source_pressure': np.float32,
+    'source_flow': np.float32,
+}
+REQUIRED_COLUMNS = ['timestamp'] + list(SENSOR_SCHEMA)
+# Streamed records are converted to typed columns this many at a time
+STREAM_BLOCK_ROWS = 8192
+# Records are requested from this long before the high-water mark, so readings that reach the API
+# late are picked up too; the store only merges the ones it does not have yet
+LATE_DATA_WINDOW = pd.Timedelta(hours=float(os.environ.get('LATE_DATA_HOURS', 6)))
 
 # Function to process data
 def process_data(data):
@@ -20,47 +40,211 @@ def process_data(data):
             print(f"Unexpected data format. Expected list or dict, got {type(data)}")
             return pd.DataFrame()
         
-        df = pd.DataFrame(data)
-        if df.empty:
+        if not data:
             print("DataFrame is empty after conversion")
-            return df
+            return pd.DataFrame()
 
-        df['timestamp'] = pd.to_datetime(df['timestamp'], format='%d-%b-%Y %H:%M:%S', errors='coerce')
-        
-        # Ensure all required columns are present
-        required_columns = ['timestamp', 'source_pH', 'source_TDS', 'source_FRC', 'source_pressure', 'source_flow']
-        for col in required_columns:
-            if col not in df.columns:
-                print(f"Missing column: {col}")
-                df[col] = None
-        
-        return df.sort_values('timestamp')
+        # Build the frame column by column instead of from a list of row dicts
+        names = list(data[0])
+        names += sorted(set().union(*data).difference(names))
+        columns = {name: [record.get(name) for record in data] for name in names}
+        return process_columns(columns)
     except Exception as e:
         print(f"Error processing data: {e}")
         return pd.DataFrame()
 
-def process_and_store_data(api_url):
-    global data_store
-    data = fetch_data_from_api(api_url)
-    if data:
-        new_data = process_data(data)
-        data_store = pd.concat([data_store, new_data]).drop_duplicates().sort_values('timestamp')
-        print("Data updated successfully")
-    else:
+def process_columns(columns):
+    # Turn raw column lists (as decoded from the API) into a typed, time-sorted frame
+    n = len(next(iter(columns.values()))) if columns else 0
+    typed = {}
+    for col in REQUIRED_COLUMNS:
+        if col not in columns:
+            print(f"Missing column: {col}")
+    typed['timestamp'] = _parse_timestamps(columns.get('timestamp', [None] * n))
+    for col, dtype in SENSOR_SCHEMA.items():
+        typed[col] = _to_float(columns[col], dtype) if col in columns else np.full(n, np.nan, dtype=dtype)
+    for col, values in columns.items():
+        if col not in typed:
+            typed[col] = _infer(values)
+
+    df = pd.DataFrame(typed, copy=False)
+    if not df['timestamp'].is_monotonic_increasing:
+        df = df.sort_values('timestamp', kind='stable', ignore_index=True)
+    return df
+
+def memory_report(df):
+    # Bytes per column (including string payloads) and the total, for comparing cached copies
+    usage = df.memory_usage(index=True, deep=True)
+    report = pd.DataFrame({'dtype': df.dtypes.astype(str).reindex(usage.index).fillna(''), 'bytes': usage})
+    report.loc['total'] = ['', usage.sum()]
+    return report
+
+def widen_float32(values):
+    # float64 copy that keeps float32's shortest decimal form (302.7, not 302.70001220703125),
+    # for values that end up in JSON or on screen
+    values = np.asarray(values)
+    if values.dtype != np.float32:
+        return values.astype(np.float64)
+    return values.astype(str).astype(np.float64)
+
+def _parse_timestamps(values):
+    if isinstance(values, np.ndarray) and values.dtype.kind == 'M':
+        # Already parsed (see collect_columns)
+        return values.astype('datetime64[ns]', copy=False)
+    parsed = _parse_fixed_width_timestamps(values)
+    if parsed is not None:
+        return parsed
+    return pd.to_datetime(pd.Series(values, dtype=object), format=TIMESTAMP_FORMAT, errors='coerce').to_numpy()
+
+_MONTH_KEYS = np.array([int.from_bytes(m.encode(), 'big') for m in
+                        ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']])
+_MONTH_ORDER = np.argsort(_MONTH_KEYS)
+
+def _parse_fixed_width_timestamps(values):
+    # Vectorized parser for 'dd-Mon-YYYY HH:MM:SS'. Works on the raw bytes; rows
+    # that do not match exactly go through pd.to_datetime, so results are identical.
+    try:
+        # One byte more than the format, so a longer string is not silently cut to a valid one
+        raw = np.array(values, dtype='S21')
+    except (TypeError, ValueError, UnicodeEncodeError):
+        return None
+    if raw.size == 0:
+        return None
+    b = raw.view(np.uint8).reshape(-1, 21).astype(np.int64)
+    digit_cols = [0, 1, 7, 8, 9, 10, 12, 13, 15, 16, 18, 19]
+    digits = b[:, digit_cols] - ord('0')
+    ok = ((digits >= 0) & (digits <= 9)).all(axis=1)
+    ok &= (b[:, 2] == ord('-')) & (b[:, 6] == ord('-')) & (b[:, 11] == ord(' '))
+    ok &= (b[:, 14] == ord(':')) & (b[:, 17] == ord(':')) & (b[:, 20] == 0)
+
+    month_key = (b[:, 3] << 16) | (b[:, 4] << 8) | b[:, 5]
+    position = np.searchsorted(_MONTH_KEYS[_MONTH_ORDER], month_key).clip(0, 11)
+    month = _MONTH_ORDER[position]
+    ok &= _MONTH_KEYS[month] == month_key
+
+    day = digits[:, 0] * 10 + digits[:, 1]
+    year = digits[:, 2] * 1000 + digits[:, 3] * 100 + digits[:, 4] * 10 + digits[:, 5]
+    hour = digits[:, 6] * 10 + digits[:, 7]
+    minute = digits[:, 8] * 10 + digits[:, 9]
+    second = digits[:, 10] * 10 + digits[:, 11]
+    months = ((year - 1970) * 12 + month).astype('datetime64[M]')
+    ok &= (day >= 1) & (hour < 24) & (minute < 60) & (second < 60)
+    ok &= months.astype('datetime64[D]') + (day - 1) < (months + 1).astype('datetime64[D]')
+
+    seconds = (day - 1) * 86400 + hour * 3600 + minute * 60 + second
+    result = months.astype('datetime64[ns]') + seconds.astype('timedelta64[s]')
+    if not ok.all():
+        bad = np.flatnonzero(~ok)
+        fallback = pd.Series(np.asarray(values, dtype=object)[bad], dtype=object)
+        result[bad] = pd.to_datetime(fallback, format=TIMESTAMP_FORMAT, errors='coerce').to_numpy()
+    return result
+
+def _to_float(values, dtype):
+    try:
+        # None becomes NaN; numeric strings are converted as well
+        return np.asarray(values, dtype=dtype)
+    except (TypeError, ValueError):
+        return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=dtype)
+
+def _infer(values):
+    series = pd.Series(values)
+    # Repeated labels (site, status, ...) become categoricals; unique ids stay plain strings
+    if pd.api.types.infer_dtype(series, skipna=True) == 'string' and series.nunique() <= len(series) // 2:
+        return pd.Categorical(series)
+    return series.to_numpy()
+
+
+_default_store = None
+
+def default_store():
+    # The ColumnStore in STORE_DIR, for callers that do not bring their own
+    global _default_store
+    if _default_store is None:
+        from column_store import ColumnStore  # column_store imports this module
+        _default_store = ColumnStore()
+    return _default_store
+
+def collect_columns(records, block_rows=STREAM_BLOCK_ROWS):
+    """Gather an iterable of record dicts into columns for process_columns().
+
+    Every `block_rows` records the timestamp and sensor values are converted to
+    their typed arrays, so at most one block of them is held as Python
+    objects. Other fields stay lists for _infer(). Records missing a field get
+    None (NaT/NaN once typed), as in process_data().
+    """
+    parts = {}
+    pending = {}
+    done = 0
+    count = 0
+
+    def flush():
+        for name, values in pending.items():
+            values.extend([None] * (count - len(values)))
+            parts[name].append(_typed_block(name, values))
+        pending.clear()
+
+    for record in records:
+        if not isinstance(record, dict):
+            raise ValueError(f"Unexpected record type: {type(record)}")
+        if not pending:
+            pending.update((name, []) for name in parts)
+        for name, value in record.items():
+            values = pending.get(name)
+            if values is None:
+                # A field seen for the first time: earlier rows did not have it
+                parts[name] = [_typed_block(name, [None] * done)] if done else []
+                values = pending[name] = [None] * count
+            values.append(value)
+        count += 1
+        if len(record) < len(pending):
+            for values in pending.values():
+                if len(values) < count:
+                    values.append(None)
+        if count == block_rows:
+            flush()
+            done += count
+            count = 0
+    flush()
+    return {name: _concat_blocks(blocks) for name, blocks in parts.items()}
+
+def _typed_block(name, values):
+    if name == 'timestamp':
+        return _parse_timestamps(values)
+    if name in SENSOR_SCHEMA:
+        return _to_float(values, SENSOR_SCHEMA[name])
+    return values
+
+def _concat_blocks(blocks):
+    if blocks and isinstance(blocks[0], np.ndarray):
+        return np.concatenate(blocks)
+    return [value for block in blocks for value in block]
+
+def process_and_store_data(api_url, store=None, **fetch_options):
+    store = store if store is not None else default_store()
+    # Decompressed, parsed and converted to columns while it downloads; no list of dicts
+    since = store.high_water_mark
+    if since is not None:
+        since -= LATE_DATA_WINDOW
+    records = fetch_records_from_api(api_url, since=since, **fetch_options)
+    if records is None:
         print("No new data to update")
-    
+        return None
+    columns = collect_columns(records)
+    if not columns:
+        return 0
+    with metrics.timed('process_data_seconds'):
+        df = process_columns(columns)
+    metrics.inc('process_data_rows_total', len(df))
+    added = store.append(df)
+    metrics.observe('store_append_seconds', store.last_update_seconds)
+    metrics.inc('store_rows_appended_total', added)
+    return added
+
 def get_todays_data():
-    global data_store
     today = datetime.now().date()
     try:
-        print("Data store before filtering:", data_store)
-        # Ensure the 'timestamp' column is a datetime object
-        if not pd.api.types.is_datetime64_any_dtype(data_store['timestamp']):
-            data_store['timestamp'] = pd.to_datetime(data_store['timestamp'])
-        # Filter for today's data
-        today_data = data_store[data_store['timestamp'].dt.date == today]
-        print("Today's data:", today_data)
-        return today_data
+        # Filter for today's data; the store is time-ordered, so this is a binary search
+        return TimeSeries(default_store().frame()).day(today)
     except Exception as e:
         print("Error occurred in get_todays_data:", e)
-        return pd.DataFrame()  # Return an empty DataFrame in case of error
\ No newline at end of file
+        return pd.DataFrame()  # Return an empty DataFrame in case of error
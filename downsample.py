@@ -0,0 +1,130 @@
+import os
+
+import numpy as np
+import pandas as pd
+from dash import Patch, no_update
+
+from data_process import widen_float32
+
+# Upper bound on points sent to the browser per trace, roughly two per pixel column
+MAX_GRAPH_POINTS = int(os.environ.get('MAX_GRAPH_POINTS', 1500))
+# How far a patched live window may outgrow its duration before it is sent whole again
+WINDOW_SLACK = 0.25
+
+
+def minmax_indices(timestamps, values, max_points=MAX_GRAPH_POINTS):
+    """Row positions that keep the shape of a series within `max_points`.
+
+    The time span is cut into max_points // 2 equal buckets, and each bucket
+    keeps its minimum and its maximum. Spikes in pH, TDS or FRC always survive,
+    because a spike is the extreme of its bucket. The first and last samples
+    are kept so the x-axis range does not change. Missing values are dropped
+    when downsampling.
+    """
+    n = len(values)
+    if n <= max_points:
+        return np.arange(n)
+
+    values = np.asarray(values, dtype=float)
+    valid = np.flatnonzero(~np.isnan(values))
+    if len(valid) == 0:
+        return np.array([0, n - 1])
+
+    t = np.asarray(timestamps, dtype='datetime64[ns]').astype(np.int64)
+    n_buckets = max(max_points // 2, 1)
+    span = max(t[-1] - t[0], 1)
+    buckets = np.minimum(((t[valid] - t[0]) / span * n_buckets).astype(np.int64), n_buckets - 1)
+
+    series = pd.Series(values[valid], index=valid)
+    grouped = series.groupby(buckets)
+    keep = np.concatenate([[0, n - 1], grouped.idxmin().to_numpy(), grouped.idxmax().to_numpy()])
+    return np.unique(keep)
+
+
+def downsample_frame(df, column, max_points=MAX_GRAPH_POINTS):
+    if len(df) <= max_points:
+        return df
+    positions = minmax_indices(df['timestamp'].to_numpy(), df[column].to_numpy(dtype=float), max_points)
+    return df.iloc[positions]
+
+
+def downsample_columns(df, columns, max_points=MAX_GRAPH_POINTS):
+    # One set of rows for several traces: the union of each column's min/max buckets
+    if len(df) <= max_points:
+        return df
+    timestamps = df['timestamp'].to_numpy()
+    positions = [minmax_indices(timestamps, df[col].to_numpy(dtype=float), max_points) for col in columns]
+    return df.iloc[np.unique(np.concatenate(positions))]
+
+
+def columnar_window(df, columns, max_points=MAX_GRAPH_POINTS):
+    """A compact, JSON-ready copy of `df` for building traces in the browser.
+
+    Timestamps become epoch milliseconds (plotly draws them on a date axis
+    as the same wall-clock time) and readings become plain lists with null
+    for missing values, sharing one time axis.
+    """
+    df = downsample_columns(df, [col for col in columns if col in df.columns], max_points)
+    values = {}
+    for col in columns:
+        if col in df.columns:
+            y = widen_float32(df[col].to_numpy())
+            values[col] = np.where(np.isnan(y), None, y).tolist()
+    t = df['timestamp'].to_numpy().astype('datetime64[ms]').astype(np.int64)
+    return {'t': t.tolist(), 'y': values}
+
+
+def live_window(series, columns, duration, key, cursor=None, max_points=MAX_GRAPH_POINTS):
+    """The last `duration` of `series` for the browser, and a cursor describing the copy it holds.
+
+    `key` identifies what the window is cut from (site, store generation and last backfill).
+    If `cursor`, as returned by an earlier call and echoed back by the
+    browser, still matches, only the new readings are sent, as a Dash Patch
+    that extends every list, or no_update when nothing changed. Readings
+    that slid out of the window are left in place (the figure is cut from
+    the end), until they make up more than WINDOW_SLACK of the window; then,
+    like whenever the window has to be downsampled, the whole
+    columnar_window() is sent again.
+    """
+    df = series.last(duration)
+    if df.empty:
+        return columnar_window(df, columns, max_points), None
+    end = df['timestamp'].iloc[-1]
+    if not _continues(series, cursor, key) or len(df) > max_points:
+        return _full_window(df, columns, key, max_points)
+    if cursor['end'] == _epoch_ms(end):
+        return no_update, no_update
+
+    added = series.between(_from_ms(cursor['end']), end, inclusive='right')
+    held = cursor['rows'] + len(added)
+    if held > len(df) * (1 + WINDOW_SLACK):
+        return _full_window(df, columns, key, max_points)
+    new = columnar_window(added, columns, max_points)
+    patch = Patch()
+    patch['t'].extend(new['t'])
+    for col, values in new['y'].items():
+        patch['y'][col].extend(values)
+    return patch, dict(cursor, end=_epoch_ms(end), rows=held)
+
+
+def _full_window(df, columns, key, max_points):
+    window = columnar_window(df, columns, max_points)
+    cursor = {'key': key, 'start': window['t'][0], 'end': window['t'][-1], 'rows': len(window['t']),
+              'raw': len(df) <= max_points}
+    return window, cursor
+
+
+def _continues(series, cursor, key):
+    # True if the browser holds exactly the rows between cursor start and end, not downsampled
+    if not cursor or cursor.get('key') != key or not cursor.get('raw'):
+        return False
+    held = series.between(_from_ms(cursor['start']), _from_ms(cursor['end']))
+    return len(held) == cursor['rows']
+
+
+def _epoch_ms(timestamp):
+    return int(np.datetime64(timestamp, 'ms').astype(np.int64))
+
+
+def _from_ms(ms):
+    return pd.Timestamp(ms, unit='ms')
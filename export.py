@@ -0,0 +1,84 @@
+import io
+import zlib
+
+EXPORT_CHUNK_ROWS = 10000
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+# Generators for streamed historical exports. Each one only materialises
+# EXPORT_CHUNK_ROWS rows at a time, so memory use does not depend on the size
+# of the export. `columns` (default: all) is applied per chunk too; selecting
+# them from the whole frame first would copy it.
+
+def iter_csv(df, columns=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    yield _chunk(df, 0, 0, columns).to_csv(index=False)
+    for start in range(0, len(df), chunk_rows):
+        yield _chunk(df, start, start + chunk_rows, columns).to_csv(index=False, header=False)
+
+
+def iter_parquet(df, columns=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _ChunkSink()
+    schema = pa.Schema.from_pandas(_chunk(df, 0, 0, columns), preserve_index=False)
+    with pq.ParquetWriter(sink, schema) as writer:
+        for start in range(0, len(df), chunk_rows):
+            chunk = pa.Table.from_pandas(_chunk(df, start, start + chunk_rows, columns), schema=schema,
+                                         preserve_index=False)
+            # One row group per chunk; hand over whatever the writer has flushed so far
+            writer.write_table(chunk)
+            yield sink.take()
+    yield sink.take()
+
+
+def _chunk(df, start, stop, columns):
+    # Rows first: df.iloc[rows, columns] would take the columns over every row before slicing
+    chunk = df.iloc[start:stop]
+    return chunk if columns is None else chunk[columns]
+
+
+def gzip_stream(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def parquet_available():
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class _ChunkSink(io.RawIOBase):
+    # Write-only file object that lets the Parquet writer's output be drained in pieces
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self):
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
@@ -1,6 +1,13 @@
-import requests
+import threading
 import time
 
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import metrics
+from json_stream import iter_json_items
+
 credentials = {
     "username": "Kamlesh123",
     "password": "1234567"
@@ -10,31 +17,190 @@ headers = {
         "Content-Type": "application/json"
     }
 
-def generate_token(api_url):
-    response = requests.post(api_url + "/get_token", json=credentials, headers=headers)
-    
-    if response.status_code == 200:
-        token = response.json().get("token")
-        # expiry_time = response.json().get("expiry_time")  # Assuming this field exists in the API response
-        return token
-    else:
-        print(f"Failed to generate token: {response.content}")
-        return None
-
-def fetch_data_from_api(api_url):
-    token = generate_token(api_url)  # Adjust the endpoint accordingly
-    
-    if not token:
-        return None
-    
-    headers = {
-        "Authorization": f"Bearer {token}"
-    }
-    
-    response = requests.get(api_url + "/suman_nagar_data", headers=headers)
-    
-    if response.status_code == 200:
-        return response.json()
-    else:
-        print(f"Failed to fetch data: {response.content}")
-        return None         
+# Used when the token response does not say how long the token lives
+DEFAULT_TOKEN_TTL = 30 * 60
+# Refresh the token a little before it actually expires
+TOKEN_EXPIRY_MARGIN = 60
+REQUEST_TIMEOUT = (10, 60)
+DATA_PATH = "/suman_nagar_data"
+STREAM_CHUNK_BYTES = 64 * 1024
+TIMESTAMP_FORMAT = '%d-%b-%Y %H:%M:%S'
+
+
+class ApiClient:
+    """Sensor API client that reuses its bearer token and keep-alive connections.
+
+    Requests are spaced at least `min_interval` seconds apart, which keeps each
+    site under its API's rate limit however many threads share the client.
+    """
+
+    def __init__(self, api_url, data_path=DATA_PATH, pool_size=16, retries=3, backoff_factor=0.5,
+                 timeout=REQUEST_TIMEOUT, min_interval=0.0):
+        self.api_url = api_url
+        self.data_path = data_path
+        self.timeout = timeout
+        self.min_interval = min_interval
+        self._next_request_at = 0.0
+        self._throttle_lock = threading.Lock()
+        self.session = requests.Session()
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET', 'POST'])
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._token = None
+        self._token_expires_at = 0.0
+        self._token_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.token_requests = 0
+        self.fetches = 0
+        self.last_latency = None
+        self.total_latency = 0.0
+
+    def get_token(self, force=False):
+        with self._token_lock:
+            if not force and self._token and time.time() < self._token_expires_at:
+                return self._token
+            token, ttl = self._request_token()
+            self._token = token
+            self._token_expires_at = time.time() + max(ttl - TOKEN_EXPIRY_MARGIN, 0) if token else 0.0
+            return token
+
+    def invalidate_token(self):
+        with self._token_lock:
+            self._token = None
+            self._token_expires_at = 0.0
+
+    def _throttle(self):
+        with self._throttle_lock:
+            now = time.monotonic()
+            wait = self._next_request_at - now
+            self._next_request_at = max(now, self._next_request_at) + self.min_interval
+        if wait > 0:
+            time.sleep(wait)
+
+    def _request_token(self):
+        self.token_requests += 1
+        metrics.inc('api_token_requests_total', endpoint=self.data_path)
+        self._throttle()
+        with metrics.timed('api_token_seconds', endpoint=self.data_path):
+            response = self.session.post(self.api_url + "/get_token", json=credentials, headers=headers,
+                                         timeout=self.timeout)
+        if response.status_code != 200:
+            metrics.inc('api_errors_total', endpoint=self.data_path, stage='token', status=response.status_code)
+            print(f"Failed to generate token: {response.content}")
+            return None, 0
+        body = response.json()
+        ttl = body.get("expires_in") or DEFAULT_TOKEN_TTL
+        return body.get("token"), float(ttl)
+
+    def fetch_data(self, since=None):
+        start = time.perf_counter()
+        response = self._open_data(since)
+        if response is None:
+            return None
+        data = response.json()
+        self._finish(response, start)
+        return data
+
+    def stream_records(self, since=None):
+        """Iterator over the records, None if the request failed.
+
+        The body is requested gzip-compressed and decompressed and parsed chunk
+        by chunk while it downloads, so neither the JSON text nor a list of
+        all records is ever held in memory.
+        """
+        start = time.perf_counter()
+        response = self._open_data(since, stream=True)
+        if response is None:
+            return None
+        return self._iter_records(response, start)
+
+    def _iter_records(self, response, start):
+        try:
+            yield from iter_json_items(response.iter_content(STREAM_CHUNK_BYTES))
+            self._finish(response, start)
+        finally:
+            response.close()
+
+    def _open_data(self, since, stream=False):
+        token = self.get_token()
+        if not token:
+            return None
+
+        # `since` is a hint for APIs that can return only newer records;
+        # callers still filter, so an API that ignores it stays correct
+        params = {'since': since.strftime(TIMESTAMP_FORMAT)} if since is not None else None
+        response = self._get_data(token, params, stream)
+        if response.status_code == 401:
+            # Token expired or was revoked server side; get a new one and retry once
+            response.close()
+            self.invalidate_token()
+            token = self.get_token(force=True)
+            if not token:
+                return None
+            response = self._get_data(token, params, stream)
+
+        if response.status_code != 200:
+            metrics.inc('api_errors_total', endpoint=self.data_path, stage='data', status=response.status_code)
+            print(f"Failed to fetch data: {response.content}")
+            response.close()
+            return None
+        return response
+
+    def _get_data(self, token, params=None, stream=False):
+        self._throttle()
+        return self.session.get(self.api_url + self.data_path, params=params, stream=stream,
+                                headers={"Authorization": f"Bearer {token}", "Accept-Encoding": "gzip, deflate"},
+                                timeout=self.timeout)
+
+    def _finish(self, response, start):
+        seconds = time.perf_counter() - start
+        metrics.observe('api_fetch_seconds', seconds, endpoint=self.data_path)
+        # Bytes as they came over the wire, i.e. compressed when the API supports it
+        metrics.observe('api_received_bytes', response.raw.tell(), endpoint=self.data_path)
+        self._record_latency(seconds)
+
+    def _record_latency(self, seconds):
+        with self._stats_lock:
+            self.fetches += 1
+            self.last_latency = seconds
+            self.total_latency += seconds
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'fetches': self.fetches,
+                'token_requests': self.token_requests,
+                'last_latency': self.last_latency,
+                'avg_latency': self.total_latency / self.fetches if self.fetches else None
+            }
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(api_url, data_path=DATA_PATH, **options):
+    # One client per endpoint; `options` only apply when the client is first created
+    key = (api_url, data_path)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = ApiClient(api_url, data_path, **options)
+        return _clients[key]
+
+
+def generate_token(api_url, data_path=DATA_PATH):
+    return get_client(api_url, data_path).get_token()
+
+
+def fetch_data_from_api(api_url, since=None, data_path=DATA_PATH, **options):
+    return get_client(api_url, data_path, **options).fetch_data(since=since)
+
+
+def fetch_records_from_api(api_url, since=None, data_path=DATA_PATH, **options):
+    return get_client(api_url, data_path, **options).stream_records(since=since)
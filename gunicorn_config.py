@@ -1,4 +1,23 @@
+import gc
+import os
+
 bind = "0.0.0.0:10000"
 workers = 4
-threads = 4
-timeout = 120
\ No newline at end of file
+# Each open /events stream holds a thread (see live.SSE_MAX_STREAMS)
+threads = 16
+timeout = 120
+
+# Import the app once in the master and fork the workers from it, so the
+# Dash app, the map artifact and the warm-started sensor data are shared
+# copy-on-write instead of being rebuilt by every worker.
+preload_app = os.environ.get('PRELOAD_APP', 'true').lower() == 'true'
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+    import main
+    main.ingestors.warm_start()
+    # Keep the preloaded objects out of the collector so its bookkeeping
+    # writes do not un-share their pages in the workers
+    gc.freeze()
@@ -0,0 +1,107 @@
+import math
+
+import pandas as pd
+
+from data_process import widen_float32
+from timeseries import TimeSeries
+
+# DataTable filter syntax, as in the Dash docs recipe for custom filtering
+FILTER_OPERATORS = [['ge ', '>='],
+                    ['le ', '<='],
+                    ['lt ', '<'],
+                    ['gt ', '>'],
+                    ['ne ', '!='],
+                    ['eq ', '='],
+                    ['contains '],
+                    ['datestartswith ']]
+
+TABLE_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def split_filter_part(filter_part):
+    for operator_type in FILTER_OPERATORS:
+        for operator in operator_type:
+            if operator in filter_part:
+                name_part, value_part = filter_part.split(operator, 1)
+                name = name_part[name_part.find('{') + 1: name_part.rfind('}')]
+
+                value_part = value_part.strip()
+                v0 = value_part[0] if value_part else ''
+                if v0 and v0 == value_part[-1] and v0 in ("'", '"', '`'):
+                    value = value_part[1: -1].replace('\\' + v0, v0)
+                elif operator_type[0] in ('contains ', 'datestartswith '):
+                    # Text matches stay text, so '2024' does not become '2024.0'
+                    value = value_part
+                else:
+                    try:
+                        value = float(value_part)
+                    except ValueError:
+                        value = value_part
+
+                # word operators need spaces after them in the filter string,
+                # but we don't want these later
+                return name, operator_type[0].strip(), value
+
+    return [None] * 3
+
+
+def date_range_slice(df, start_date, end_date):
+    # Whole days by binary search on the sorted timestamps; the result is a view
+    return TimeSeries(df).days(start_date, end_date)
+
+
+def apply_filter(df, filter_query):
+    for filter_part in (filter_query or '').split(' && '):
+        col_name, operator, filter_value = split_filter_part(filter_part)
+        if col_name not in df.columns:
+            continue
+        column = df[col_name]
+        if col_name == 'timestamp' and operator not in ('contains', 'datestartswith'):
+            filter_value = pd.Timestamp(str(filter_value).strip())
+
+        if operator in ('eq', 'ne', 'lt', 'le', 'gt', 'ge'):
+            df = df.loc[getattr(column, operator)(filter_value)]
+        elif operator == 'contains':
+            df = df.loc[_as_text(column).str.contains(str(filter_value), regex=False)]
+        elif operator == 'datestartswith':
+            df = df.loc[_as_text(column).str.startswith(str(filter_value))]
+    return df
+
+
+def apply_sort(df, sort_by):
+    if not sort_by:
+        return df
+    return df.sort_values(
+        [col['column_id'] for col in sort_by],
+        ascending=[col['direction'] == 'asc' for col in sort_by],
+        kind='stable'
+    )
+
+
+def query_history(df, start_date, end_date, filter_query='', sort_by=None):
+    if df.empty or not start_date or not end_date:
+        return df.iloc[:0]
+    dff = date_range_slice(df, start_date, end_date)
+    dff = apply_filter(dff, filter_query)
+    return apply_sort(dff, sort_by)
+
+
+def display_frame(df):
+    # Rows as the browser shows them: formatted timestamps, float32 readings widened
+    if 'timestamp' in df.columns:
+        df = df.assign(timestamp=df['timestamp'].dt.strftime(TABLE_TIMESTAMP_FORMAT))
+    # float32 readings would otherwise show as 7.630000114440918
+    return df.assign(**{col: widen_float32(df[col].to_numpy()) for col in df.select_dtypes('float32')})
+
+
+def page_records(dff, page_current, page_size):
+    page_current = page_current or 0
+    page = display_frame(dff.iloc[page_current * page_size:(page_current + 1) * page_size])
+    page_count = max(math.ceil(len(dff) / page_size), 1)
+    return page.to_dict('records'), page_count
+
+
+def _as_text(column):
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return column.dt.strftime(TABLE_TIMESTAMP_FORMAT)
+    return column.astype(str)
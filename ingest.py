@@ -0,0 +1,332 @@
+import os
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import pandas as pd
+
+import metrics
+from column_store import STORE_DIR, ColumnStore
+from data_process import process_and_store_data
+from pyramid import AggregatePyramid
+from rolling import RollingStats
+from rollup import DailyRollup
+from timeseries import TimeSeries
+
+try:
+    import fcntl
+except ImportError:
+    # No flock on Windows: every worker refreshes on its own
+    fcntl = None
+
+REFRESH_INTERVAL = int(os.environ.get('REFRESH_INTERVAL', 60))
+CACHE_DIR = os.environ.get('DATA_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'suman_nagar_cache'))
+# Upper bound on sites fetched at the same time by one process
+INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', 8))
+
+# A published, already-processed copy of the sensor data, its daily rollup, a
+# TimeSeries for window queries over it, the rolling statistics table and the
+# hourly/daily/weekly aggregate levels (see pyramid.query_history_levels).
+# Callbacks must treat all of them as read-only because the same objects are
+# handed to every request. `generation` only changes when the store's history
+# was rewritten rather than appended to; `backfilled` is the store version of
+# the latest merge of late rows within it (0 if none).
+Snapshot = namedtuple('Snapshot', ['version', 'df', 'updated_at', 'error', 'daily', 'series', 'rolling',
+                                   'generation', 'levels', 'backfilled'])
+EMPTY_SNAPSHOT = Snapshot(0, pd.DataFrame(), 0.0, None, DailyRollup().table, TimeSeries(pd.DataFrame()),
+                          RollingStats({}, {}).table, 0, AggregatePyramid().levels, 0)
+
+
+class DataIngestor:
+    """Fetches the sensor data once per interval and shares it between callbacks and workers.
+
+    Inside a process only one thread refreshes at a time (single-flight); the
+    others keep reading the last good snapshot. Across gunicorn workers the
+    data is shared through a persistent ColumnStore, and an flock on a lock
+    file in `cache_dir` makes sure only one worker talks to the API per
+    interval. That worker only asks for records newer than the store's
+    high-water mark and appends them; the others re-map the store once its
+    version changes. A check that fails or finds nothing counts as well: until
+    the next interval, get() serves the empty or error snapshot rather than
+    asking the API again.
+
+    `fetch_options` are passed through to fetch_data_from_api (data path, rate
+    limit, timeout). With `background=False` no refresher thread is started;
+    the owner (see SiteIngestors) is then expected to call refresh().
+    `rolling_windows` and `rolling_ranges` configure the RollingStats kept
+    alongside the daily rollup; without windows the rolling table stays empty.
+    """
+
+    def __init__(self, api_url, interval=REFRESH_INTERVAL, cache_dir=CACHE_DIR, store=None,
+                 fetch_options=None, background=True, rolling_windows=None, rolling_ranges=None):
+        self.api_url = api_url
+        self.fetch_options = fetch_options or {}
+        self.background = background
+        self.interval = interval
+        self.cache_dir = cache_dir
+        self.lock_path = os.path.join(cache_dir, 'refresh.lock')
+        # Touched whenever a worker has checked the API, even if nothing new arrived
+        self.heartbeat_path = os.path.join(cache_dir, 'checked')
+        self.store = store if store is not None else ColumnStore()
+        self.rollup = DailyRollup()
+        self.rolling = RollingStats(rolling_windows or {}, rolling_ranges or {})
+        self.pyramid = AggregatePyramid()
+        self._snapshot = EMPTY_SNAPSHOT
+        # Notified whenever a snapshot with new data is published
+        self._published = threading.Condition()
+        self._refresh_lock = threading.Lock()
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def get(self):
+        self._ensure_started()
+        self.warm_start()
+        if self._snapshot.version == 0 and self._is_stale(self._snapshot):
+            # Nothing published or tried yet: wait for the in-flight refresh instead of serving nothing
+            self.refresh(wait=True)
+        return self._snapshot
+
+    def warm_start(self):
+        # Publish whatever is already on disk without touching the network or starting
+        # threads, so it is safe to call in the gunicorn master before forking
+        if self._snapshot.version == 0 and self.store.version:
+            with self._refresh_lock:
+                if self._snapshot.version == 0:
+                    self._publish(0.0)
+        return self._snapshot
+
+    def get_data(self):
+        return self.get().df
+
+    def wait_for_update(self, version, timeout=None):
+        # Block until a snapshot other than `version` is published (or the timeout passes)
+        with self._published:
+            self._published.wait_for(lambda: self._snapshot.version != version, timeout)
+        return self._snapshot
+
+    def refresh(self, wait=False):
+        if not self._refresh_lock.acquire(blocking=wait):
+            return self._snapshot
+        try:
+            if not self._is_stale(self._snapshot):
+                return self._snapshot
+            self._refresh()
+        except Exception as e:
+            metrics.inc('ingest_errors_total')
+            print(f"Error refreshing data: {e}")
+            # A failed attempt counts as a check, so the API is not retried before the next interval
+            self._snapshot = self._snapshot._replace(error=str(e), updated_at=time.time())
+        finally:
+            self._refresh_lock.release()
+        return self._snapshot
+
+    def _ensure_started(self):
+        # Threads do not survive fork, so the refresher is started per process on first use
+        if not self.background or self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='data-ingestor', daemon=True).start()
+
+    def _run(self):
+        while True:
+            self.refresh()
+            time.sleep(self.interval)
+
+    def _is_stale(self, snapshot):
+        # updated_at is the last check of the API, whether or not it returned anything
+        return time.time() - snapshot.updated_at >= self.interval
+
+    def _refresh(self):
+        if self._sync_shared():
+            return
+        # With nothing to serve yet, wait for the worker that holds the lock
+        with _FileLock(self.lock_path, blocking=self._snapshot.version == 0) as acquired:
+            if not acquired:
+                # Another worker is fetching right now; keep serving what we have
+                return
+            # The previous lock holder may have checked the API while we were waiting
+            if self._sync_shared():
+                return
+            self._fetch_and_publish()
+
+    def _fetch_and_publish(self):
+        try:
+            added = process_and_store_data(self.api_url, self.store, **self.fetch_options)
+        finally:
+            # Also after a failure or an empty answer, so the other workers wait for the next interval too
+            self._touch_heartbeat()
+        if added is None:
+            self._snapshot = self._snapshot._replace(error="No data received from API", updated_at=time.time())
+            return
+        self._publish(time.time())
+
+    def _sync_shared(self):
+        # Pick up data another worker appended; True if the API was checked recently enough
+        if self.store.version != self._snapshot.version:
+            self._publish(self._snapshot.updated_at)
+        checked_at = self._last_checked()
+        if time.time() - checked_at < self.interval:
+            self._snapshot = self._snapshot._replace(updated_at=max(self._snapshot.updated_at, checked_at))
+            return True
+        return False
+
+    def _publish(self, updated_at):
+        frame = self.store.frame()
+        generation = self.store.generation
+        # Only the rows added since the last publish are folded into the rollup
+        daily = self.rollup.sync(frame, generation)
+        rolling = self.rolling.sync(frame, generation)
+        levels = self.pyramid.sync(frame, generation)
+        if self._snapshot.version and generation == self._snapshot.generation:
+            # Late rows merged since the last publish: redo only the days and buckets they fall in
+            start, days = self.store.late_since(self._snapshot.version)
+            if days is None:
+                daily, rolling, levels = (self.rollup.rebuild(frame), self.rolling.rebuild(frame),
+                                          self.pyramid.rebuild(frame))
+            elif days:
+                daily = self.rollup.recompute_days(frame, days)
+                rolling = self.rolling.recompute_since(frame, start)
+                levels = self.pyramid.recompute_since(frame, start)
+        self._snapshot = Snapshot(self.store.version, frame, updated_at, None, daily, TimeSeries(frame), rolling,
+                                  generation, levels, self.store.last_backfill)
+        with self._published:
+            self._published.notify_all()
+
+    def _last_checked(self):
+        try:
+            return os.stat(self.heartbeat_path).st_mtime
+        except FileNotFoundError:
+            return 0.0
+
+    def _touch_heartbeat(self):
+        try:
+            with open(self.heartbeat_path, 'a'):
+                pass
+            os.utime(self.heartbeat_path)
+        except OSError as e:
+            print(f"Could not update heartbeat: {e}")
+
+
+class SiteIngestors:
+    """One DataIngestor per registered site, refreshed together on a bounded thread pool.
+
+    Every site has its own ColumnStore (`store_dir/<slug>`) and lock/heartbeat
+    directory (`cache_dir/<slug>`). A single refresher thread per process
+    submits all sites to the pool each interval and waits for the round, so a
+    round takes as long as the slowest site rather than the sum of all of
+    them, and at most `max_workers` API calls are in flight at once. With
+    `background=False` that thread is not started and refresh_all() is left
+    to the caller. `rolling_windows` and `rolling_ranges` go to every site's
+    DataIngestor.
+    """
+
+    def __init__(self, sites, interval=REFRESH_INTERVAL, cache_dir=CACHE_DIR, store_dir=STORE_DIR,
+                 max_workers=INGEST_WORKERS, background=True, rolling_windows=None, rolling_ranges=None):
+        self.interval = interval
+        self.background = background
+        self.max_workers = max_workers
+        self._ingestors = {}
+        for site in sites:
+            fetch_options = {'data_path': site.data_path, 'timeout': site.timeout,
+                             'min_interval': site.min_request_interval}
+            self._ingestors[site.slug] = DataIngestor(
+                site.api_url, interval, os.path.join(cache_dir, site.slug),
+                ColumnStore(os.path.join(store_dir, site.slug)), fetch_options, background=False,
+                rolling_windows=rolling_windows, rolling_ranges=rolling_ranges
+            )
+        self.last_round = {}
+        self._pool = None
+        self._pool_pid = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def __contains__(self, slug):
+        return slug in self._ingestors
+
+    def __getitem__(self, slug):
+        return self._ingestors[slug]
+
+    def get(self, slug):
+        self._ensure_started()
+        return self._ingestors[slug].get()
+
+    def wait_for_update(self, slug, version, timeout=None):
+        self._ensure_started()
+        return self._ingestors[slug].wait_for_update(version, timeout)
+
+    def warm_start(self):
+        for ingestor in self._ingestors.values():
+            ingestor.warm_start()
+
+    def refresh_all(self, wait_for_lock=False):
+        # Returns how long each site took; the round itself takes about the maximum
+        self._ensure_pool()
+        started = time.perf_counter()
+        futures = {slug: self._pool.submit(self._timed_refresh, slug, ingestor, wait_for_lock)
+                   for slug, ingestor in self._ingestors.items()}
+        wait(futures.values())
+        durations = {slug: future.result() for slug, future in futures.items()}
+        self.last_round = {'seconds': time.perf_counter() - started, 'sites': durations}
+        return durations
+
+    def _timed_refresh(self, slug, ingestor, wait_for_lock):
+        start = time.perf_counter()
+        ingestor.refresh(wait=wait_for_lock)
+        seconds = time.perf_counter() - start
+        metrics.observe('ingest_refresh_seconds', seconds, site=slug)
+        return seconds
+
+    def _ensure_pool(self):
+        # Like threads, a pool does not survive fork; each process makes its own
+        with self._start_lock:
+            if self._pool_pid != os.getpid():
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='site-ingest')
+                self._pool_pid = os.getpid()
+
+    def _ensure_started(self):
+        if not self.background or self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='site-ingestors', daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh_all()
+            except Exception as e:
+                print(f"Error refreshing sites: {e}")
+            time.sleep(self.interval)
+
+
+class _FileLock:
+    def __init__(self, path, blocking=False):
+        self.path = path
+        self.blocking = blocking
+        self._f = None
+
+    def __enter__(self):
+        if fcntl is None:
+            return True
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._f = open(self.path, 'a')
+        try:
+            fcntl.flock(self._f, fcntl.LOCK_EX if self.blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            self._f.close()
+            self._f = None
+            return False
+
+    def __exit__(self, *exc):
+        if self._f is not None:
+            fcntl.flock(self._f, fcntl.LOCK_UN)
+            self._f.close()
+            self._f = None
@@ -0,0 +1,94 @@
+import codecs
+import json
+
+_WHITESPACE = ' \t\n\r'
+_DELIMITERS = _WHITESPACE + ',]}'
+
+
+def iter_json_items(chunks):
+    """Yield the items of a top-level JSON array as the text arrives.
+
+    `chunks` is an iterable of bytes (UTF-8) or str. Only one item's worth of
+    unparsed text is kept besides the current chunk, so the whole document is
+    never held in memory. A top-level object instead of an array is yielded
+    as a single item. Raises ValueError on malformed or truncated input.
+    """
+    decode = json.JSONDecoder().raw_decode
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer, pos = '', 0
+    state = 'start'
+    after_item = False
+    after_comma = False
+    for chunk in _with_end(chunks):
+        final = chunk is None
+        if final:
+            text = text_decoder.decode(b'', final=True)
+        else:
+            text = text_decoder.decode(chunk) if isinstance(chunk, (bytes, bytearray)) else chunk
+        buffer = buffer[pos:] + text
+        pos = 0
+        while True:
+            pos = _skip_whitespace(buffer, pos)
+            if pos == len(buffer):
+                break
+            char = buffer[pos]
+            if state == 'start':
+                if char == '[':
+                    state = 'items'
+                    pos += 1
+                    continue
+                state = 'single'
+            elif state == 'items' and char == ']':
+                if after_comma:
+                    raise ValueError("Trailing comma in the JSON array")
+                state = 'done'
+                pos += 1
+                continue
+            elif state == 'items' and char == ',' and after_item:
+                after_item = False
+                after_comma = True
+                pos += 1
+                continue
+            elif state == 'items' and after_item:
+                raise ValueError(f"Expected ',' or ']' in the JSON array: {buffer[pos:pos + 20]!r}")
+            elif state == 'done':
+                raise ValueError(f"Unexpected data after the JSON document: {buffer[pos:pos + 20]!r}")
+            try:
+                item, pos_after = decode(buffer, pos)
+            except json.JSONDecodeError:
+                if final:
+                    raise
+                # The item continues in the next chunk
+                break
+            if not isinstance(item, (dict, list, str)):
+                # A number or literal is only complete once a delimiter follows it
+                token_end = _token_end(buffer, pos)
+                if token_end == len(buffer) and not final:
+                    break
+                if pos_after != token_end:
+                    raise ValueError(f"Malformed JSON value: {buffer[pos:token_end][:40]!r}")
+            yield item
+            pos = pos_after
+            after_item = True
+            after_comma = False
+            if state == 'single':
+                state = 'done'
+    if state != 'done':
+        raise ValueError("Truncated JSON document")
+
+
+def _with_end(chunks):
+    yield from chunks
+    yield None
+
+
+def _token_end(text, pos):
+    while pos < len(text) and text[pos] not in _DELIMITERS:
+        pos += 1
+    return pos
+
+
+def _skip_whitespace(text, pos):
+    while pos < len(text) and text[pos] in _WHITESPACE:
+        pos += 1
+    return pos
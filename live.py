@@ -0,0 +1,68 @@
+import json
+import os
+import threading
+import time
+
+# Server-Sent Events for new sensor readings. A stream sleeps on the
+# site ingestor's condition variable and only wakes when a new data version is
+# published (plus a cheap keep-alive comment), so idle clients cost no CPU.
+# Events are bare notifications: the dashboard callbacks they trigger read
+# the new rows from the shared snapshot (the live window as a small Patch),
+# so no reading is sent twice. Each open stream holds one server thread,
+# hence the per-process cap; a client over the cap is told to retry later
+# and polls in the meantime.
+SSE_MAX_STREAMS = int(os.environ.get('SSE_MAX_STREAMS', 8))
+# Streams are closed after this long and the browser reconnects with
+# Last-Event-ID, so a stream never outlives a worker restart for long
+SSE_STREAM_SECONDS = int(os.environ.get('SSE_STREAM_SECONDS', 300))
+SSE_KEEPALIVE_SECONDS = 15
+SSE_RETRY_MS = 3000
+SSE_BUSY_RETRY_MS = 60000
+
+_streams = threading.BoundedSemaphore(SSE_MAX_STREAMS)
+
+
+def event_stream(ingestors, site, last_event_id=None, stream_seconds=SSE_STREAM_SECONDS,
+                 keepalive=SSE_KEEPALIVE_SECONDS):
+    # Acquired inside the generator so the slot is released however the stream ends
+    if not _streams.acquire(blocking=False):
+        yield f"retry: {SSE_BUSY_RETRY_MS}\n\n"
+        return
+    try:
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        # Through SiteIngestors, so the refresher is running even if this is the worker's first request
+        snapshot = ingestors.get(site)
+        # Event ids are store versions; a reconnecting client is told at once if it missed one
+        if _parse_event_id(last_event_id) not in (None, snapshot.version):
+            yield version_event(site, snapshot)
+        else:
+            yield f"id: {snapshot.version}\n\n"
+
+        version = snapshot.version
+        deadline = time.monotonic() + stream_seconds
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            snapshot = ingestors.wait_for_update(site, version, min(keepalive, remaining))
+            if snapshot.version == version:
+                yield ": keepalive\n\n"
+                continue
+            version = snapshot.version
+            yield version_event(site, snapshot)
+    finally:
+        _streams.release()
+
+
+def version_event(site, snapshot):
+    latest = snapshot.series.end
+    payload = {'site': site, 'version': snapshot.version,
+               'latest': latest.isoformat() if latest is not None else None}
+    return f"id: {snapshot.version}\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n"
+
+
+def _parse_event_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
@@ -1,25 +1,32 @@
+import math
 import os
+import time
 import pandas as pd
-import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
 from collections import defaultdict
-import requests
-from flask import Flask, request, render_template, redirect, url_for
+from urllib.parse import urlencode
+from flask import Flask, Response, g, jsonify, request, render_template, redirect, send_from_directory, url_for
 import dash
 from dash import dcc, html, dash_table
-from dash.dependencies import Input, Output, State
-import plotly.graph_objs as go
-import geopandas as gpd
-import folium
-from folium.plugins import MarkerCluster
-from branca.colormap import LinearColormap
-from functools import lru_cache
+from dash.dependencies import ClientsideFunction, Input, Output, State
+import plotly.io as pio
+import metrics
 # Import custom modules
-from data_process import process_data
-from get_data import fetch_data_from_api
+from data_process import SENSOR_SCHEMA
+from downsample import MAX_GRAPH_POINTS, live_window
+from export import EXPORT_FORMATS, gzip_stream, iter_csv, iter_parquet, parquet_available
+from history import page_records, query_history
+from ingest import SiteIngestors
+from live import event_stream
+from map_builder import MAP_DIR, ensure_map_artifact
+from profiling import finish_profile, start_profile, wants_profile
+from pumping import daily_pumping_summary
+from pyramid import history_series, query_history_levels
+from rolling import QUALITY_PARAMETERS, stats_records
+from sites import DEFAULT_SITE, SITES
+from spatial import LAYERS as GEO_LAYERS, spatial_index
 # Configuration
-API_URL = "https://mongodb-api-hmeu.onrender.com"
-COLUMNS = ["source_pH", "source_TDS", "source_FRC", "source_pressure", "source_flow"]
+COLUMNS = list(SENSOR_SCHEMA)
 Y_RANGES = {
     "source_pH": [7, 10],
     "source_TDS": [0, 500],
@@ -48,35 +55,13 @@ UNITS = {
 
 # Analysis functions
 def calculate_pumping_time_and_flow(df):
+    summary = daily_pumping_summary(df)
     daily_pumping_times = defaultdict(timedelta)
     daily_flow_sums = defaultdict(float)
-    start_time = None
-    current_day = None
-    
-    for _, row in df.iterrows():
-        timestamp = row['timestamp']
-        source_flow = float(row['source_flow'])
-        day = timestamp.date()
-        
-        if current_day is None:
-            current_day = day
-        if day != current_day:
-            start_time = None
-            current_day = day
-        
-        if source_flow > 0:
-            daily_flow_sums[day] += source_flow
-            if start_time is None:
-                start_time = timestamp
-        elif source_flow == 0 and start_time is not None:
-            end_time = timestamp
-            daily_pumping_times[day] += end_time - start_time
-            start_time = None
-    
-    if start_time is not None:
-        end_time = timestamp
-        daily_pumping_times[day] += end_time - start_time
-    
+    for day, row in zip(summary.index.date, summary.itertuples()):
+        daily_pumping_times[day] += timedelta(seconds=row.pumping_seconds)
+        if row.flow_sum:
+            daily_flow_sums[day] += row.flow_sum
     return daily_pumping_times, daily_flow_sums
 
 def format_timedelta(td):
@@ -86,8 +71,9 @@ def format_timedelta(td):
     seconds = total_seconds % 60
     return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
 
-def calculate_lpcd(df, population=10000):
-    daily_flow = df.groupby(df['timestamp'].dt.date)['source_flow'].sum() * 1000
+def calculate_lpcd(daily, population=10000):
+    # `daily` is the DailyRollup table, so this is O(days) rather than O(samples)
+    daily_flow = daily['flow_sum'] * 1000
     return daily_flow / population
 
 def analyze_water_quality(df):
@@ -98,6 +84,8 @@ def analyze_water_quality(df):
     }
 
 def plot_trends(df, lpcd):
+    # matplotlib is only needed here, so it is not imported at startup
+    import matplotlib.pyplot as plt
     fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 10))
     ax1.plot(lpcd.index, lpcd.values)
     ax1.set_title('LPCD Trend')
@@ -117,77 +105,46 @@ server.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', os.urandom(24))
 # Initialize Dash
 app = dash.Dash(__name__, server=server, url_base_pathname='/dashboard/')
 
-# Load GeoJSON data
-@lru_cache(maxsize=None)
-def load_geojson():
-    geojson_path = "SumanNagar.geojson"
-    return gpd.read_file(geojson_path)
-
-# Load and process Excel data
-@lru_cache(maxsize=None)
-def load_excel_data():
-    df = pd.read_excel('BOTH_WQ.xlsx', sheet_name="Suman_Nagar")
-    return gpd.GeoDataFrame(
-        df, geometry=gpd.points_from_xy(df.Longitude, df.Latitude), crs="EPSG:4326"
-    )
-
-gdf = load_geojson()
-excel_gdf = load_excel_data()
-def create_map():
-    excel_gdf_4326 = excel_gdf.to_crs(epsg=4326)
-    map_center = [excel_gdf_4326.geometry.y.mean(), excel_gdf_4326.geometry.x.mean()]
-    m = folium.Map(location=map_center, zoom_start=14)
-    
-    colormap_tds = LinearColormap(
-        colors=['green', 'yellow', 'red'],
-        vmin=excel_gdf_4326['Total Dissolved Solids (TDS)'].min(),
-        vmax=excel_gdf_4326['Total Dissolved Solids (TDS)'].max(),
-        caption='Total Dissolved Solids (TDS)'
-    )
-    
-    marker_cluster_tds = MarkerCluster(name="TDS Data").add_to(m)
-    
-    def create_popup_content(row):
-        return f"""
-        Village: {row['Village']}<br>
-        pH: {row['pH']}<br>
-        TDS: {row['Total Dissolved Solids (TDS)']} mg/L<br>
-        FRC: {row['Free Residual Chlorine (FRC)']} mg/L<br>
-        Altitude: {row['Altitude']} m<br>
-        Pressure: {row['Pressure']} (bar)<br>
-        Tap Flow Rate: {row['Tap Flow Rate']} (m3)<br>
-        """
-    
-    for idx, row in excel_gdf_4326.iterrows():
-        fill_color = colormap_tds(row['Total Dissolved Solids (TDS)'])
-        
-        folium.CircleMarker(
-            location=[row.geometry.y, row.geometry.x],
-            radius=3,
-            popup=folium.Popup(create_popup_content(row), max_width=300),
-            tooltip=row['Village'],
-            color=fill_color,
-            fillColor=fill_color,
-            fillOpacity=1,
-            weight=2
-        ).add_to(marker_cluster_tds)
-    
-    folium.GeoJson(
-        gdf,
-        name="Dadupur",
-        style_function=lambda feature: {
-            'fillColor': 'blue',
-            'color': 'black',
-            'weight': 2,
-            'fillOpacity': 0.1
-        },
-        tooltip=folium.GeoJsonTooltip(fields=['Name'], aliases=['Name: '])
-    ).add_to(m)
-    
-    folium.LayerControl().add_to(m)
-    colormap_tds.add_to(m)
-    
-    return m
+# Shared, single-flight data sources for all callbacks, one per site
+ingestors = SiteIngestors(SITES.values(), rolling_windows=TIME_DURATIONS, rolling_ranges=Y_RANGES)
+
+# Build (or reuse) each site's content-hashed map artifact; they are served by URL below
+map_artifacts = {slug: ensure_map_artifact(site) for slug, site in SITES.items()}
+
+def resolve_site(pathname):
+    # /dashboard/ is the default site, /dashboard/<slug>/ any other; None if unknown
+    slug = app.strip_relative_path(pathname or '').split('/')[0] or DEFAULT_SITE
+    return SITES.get(slug)
+
+def date_bounds(start_date, end_date):
+    # [start, end) covering whole days from start_date through end_date, as TimeSeries.days() does
+    start = pd.Timestamp(start_date).normalize()
+    return start, pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1)
+
+def callback_name():
+    # Name of the Dash callback function being served, e.g. 'update_dashboard'
+    body = request.get_json(silent=True) or {}
+    func = app.callback_map.get(body.get('output'), {}).get('callback')
+    return getattr(func, '__name__', 'unknown')
+
+@server.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if wants_profile(request.headers):
+        g.profiler = start_profile()
+
+@server.after_request
+def record_request_metrics(response):
+    is_callback = request.path == app.config.requests_pathname_prefix + '_dash-update-component'
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        response.headers['X-Profile-File'] = finish_profile(
+            profiler, callback_name() if is_callback else request.path)
+    if is_callback:
+        name = callback_name()
+        metrics.observe('callback_seconds', time.perf_counter() - g.request_started, callback=name)
+        metrics.observe('callback_response_bytes', response.calculate_content_length() or 0, callback=name)
+    return response
 
 # Flask routes
 @server.route('/')
@@ -204,6 +161,132 @@ def login():
 def dash_app():
     return app.index()
 
+@server.route('/metrics')
+def prometheus_metrics():
+    # Summed over every worker of this server (see metrics.Registry)
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+@server.route('/maps/<path:filename>')
+def map_file(filename):
+    # Artifacts are content-hashed, so they can be cached for good
+    response = send_from_directory(os.path.abspath(MAP_DIR), filename, max_age=31536000)
+    response.cache_control.immutable = True
+    response.cache_control.public = True
+    return response
+
+@server.route('/export/historical')
+def export_historical():
+    site = SITES.get(request.args.get('site', DEFAULT_SITE))
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    export_format = request.args.get('format', 'csv')
+    compress = request.args.get('gzip', '0').lower() in ('1', 'true')
+    if site is None:
+        return "Unknown site", 404
+    if not start_date or not end_date:
+        return "start_date and end_date are required", 400
+    if export_format not in EXPORT_FORMATS:
+        return f"Unsupported format: {export_format}", 400
+    if export_format == 'parquet' and not parquet_available():
+        return "Parquet export requires pyarrow", 501
+
+    try:
+        # A view over the store; the generators below only copy one chunk at a time
+        with metrics.timed('filter_seconds', stage='export'):
+            df = query_history(ingestors.get(site.slug).df, start_date, end_date, request.args.get('filter', ''))
+        columns = [col for col in ['timestamp'] + COLUMNS if col in df.columns]
+    except Exception as e:
+        return f"Invalid export request: {e}", 400
+
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    chunks = iter_parquet(df, columns) if export_format == 'parquet' else iter_csv(df, columns)
+    filename = f"historical_data_{site.slug}_{start_date}_{end_date}.{extension}"
+    if compress:
+        chunks = gzip_stream(chunks)
+        mimetype, filename = 'application/gzip', filename + '.gz'
+    return Response(chunks, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@server.route('/stats/<slug>')
+def rolling_stats(slug):
+    # Rolling statistics of every window (or just ?window=<label>), as of the latest reading
+    window = request.args.get('window')
+    if slug not in SITES:
+        return "Unknown site", 404
+    if window is not None and window not in TIME_DURATIONS:
+        return f"Unknown window: {window}", 400
+    snapshot = ingestors.get(slug)
+    latest = snapshot.series.end
+    return jsonify(site=slug, latest=latest.isoformat() if latest is not None else None,
+                   windows=stats_records(snapshot.rolling, window))
+
+@server.route('/history/<slug>')
+def history_levels(slug):
+    # Min/mean/max over whole days, from the coarsest pre-aggregated level that still gives enough points
+    site = SITES.get(slug)
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    columns = request.args.getlist('column') or COLUMNS
+    if site is None:
+        return "Unknown site", 404
+    if not start_date or not end_date:
+        return "start_date and end_date are required", 400
+    if any(col not in COLUMNS for col in columns):
+        return "Unknown column", 400
+    try:
+        start, end = date_bounds(start_date, end_date)
+        points = min(int(request.args.get('points', MAX_GRAPH_POINTS)), MAX_GRAPH_POINTS)
+    except ValueError as e:
+        return f"Invalid history request: {e}", 400
+    snapshot = ingestors.get(slug)
+    with metrics.timed('filter_seconds', stage='history_levels'):
+        level, frame = query_history_levels(snapshot.series, snapshot.levels, start, end, columns, max(points, 1))
+    return jsonify(site=slug, **history_series(level, frame, columns))
+
+@server.route('/geo/<slug>/lookup')
+def geo_lookup(slug):
+    # Nearest survey sample to ?lon=&lat= and the boundaries containing that point, for map popups
+    site = SITES.get(slug)
+    if site is None:
+        return "Unknown site", 404
+    try:
+        lon, lat = float(request.args['lon']), float(request.args['lat'])
+    except (KeyError, ValueError):
+        return "lon and lat are required numbers", 400
+    with metrics.timed('filter_seconds', stage='geo_lookup'):
+        result = spatial_index(site).lookup(lon, lat)
+    return jsonify(site=slug, **result)
+
+@server.route('/geo/<slug>/<layer>')
+def geo_features(slug, layer):
+    # GeoJSON of the samples or boundaries in ?bbox=<min lon>,<min lat>,<max lon>,<max lat>, simplified for ?zoom=
+    site = SITES.get(slug)
+    if site is None or layer not in GEO_LAYERS:
+        return "Unknown site or layer", 404
+    try:
+        bbox = [float(value) for value in request.args.get('bbox', '').split(',')]
+        zoom = int(request.args.get('zoom', 14))
+        if len(bbox) != 4 or not all(map(math.isfinite, bbox)) or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+            raise ValueError("bbox must be <min lon>,<min lat>,<max lon>,<max lat>")
+    except ValueError as e:
+        return f"Invalid bbox request: {e}", 400
+    with metrics.timed('filter_seconds', stage='geo_features'):
+        body = spatial_index(site).features(layer, bbox, zoom)
+    response = Response(body, mimetype='application/geo+json')
+    # Survey data only changes with a deployment (which also renames the map artifact)
+    response.cache_control.max_age = 3600
+    response.cache_control.public = True
+    return response
+
+@server.route('/events/<slug>')
+def live_events(slug):
+    # Server-Sent Events: one bare notification per new data version (see live.py)
+    if slug not in SITES:
+        return "Unknown site", 404
+    return Response(event_stream(ingestors, slug, request.headers.get('Last-Event-ID')),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 # Dash layout components
 def create_header():
     return html.Div([
@@ -211,15 +294,35 @@ def create_header():
             html.Img(src="/static/logo.png", style={'height': '80px', 'width': 'auto'}),
             html.Div([
                 html.H1("Water Monitoring Unit", style={'text-align': 'center', 'color': '#010738', 'margin': '0'}),
-                html.H3("Suman Nagar", style={'text-align': 'center', 'color': '#010738', 'margin': '8px 0 0 0'}),
+                html.H3(SITES[DEFAULT_SITE].name, id='site-name',
+                        style={'text-align': 'center', 'color': '#010738', 'margin': '8px 0 0 0'}),
             ]),
             html.Div([
                 html.Img(src="/static/itc_logo.png", style={'height': '80px', 'width': 'auto', 'marginRight': '10px'}),
                 html.Img(src="/static/EyeNet Aqua.png", style={'height': '90px', 'width': 'auto'}),
             ], style={'display': 'flex', 'alignItems': 'center'})
-        ], style={'display': 'flex', 'justifyContent': 'space-between', 'alignItems': 'center', 'maxWidth': '1200px', 'margin': '0 auto', 'padding': '0 20px'})
+        ], style={'display': 'flex', 'justifyContent': 'space-between', 'alignItems': 'center', 'maxWidth': '1200px', 'margin': '0 auto', 'padding': '0 20px'}),
+        create_site_links()
     ], style={'width': '100%', 'backgroundColor': '#f5f5f5', 'padding': '10px 0', 'boxShadow': '0 2px 5px rgba(0,0,0,0.1)'})
 
+def create_site_links():
+    # Only shown once there is more than one site to switch between
+    if len(SITES) < 2:
+        return None
+    return html.Div([
+        dcc.Link(site.name, href=app.get_relative_path(f'/{slug}/'), style={'margin': '0 10px'})
+        for slug, site in SITES.items()
+    ], style={'textAlign': 'center', 'marginTop': '10px'})
+
+def graph_config():
+    # Static settings for the clientside figure builder
+    return {
+        'durations': {label: duration.total_seconds() * 1000 for label, duration in TIME_DURATIONS.items()},
+        'ranges': Y_RANGES,
+        'units': {col: UNITS[col.split('_')[1]] for col in COLUMNS},
+        'template': pio.templates[pio.templates.default].to_plotly_json(),
+    }
+
 def create_footer():
     return html.Footer([
         html.Div([
@@ -230,6 +333,7 @@ def create_footer():
 
 # Dash layout
 app.layout = html.Div([
+    dcc.Location(id='url', refresh=False),
     create_header(),
     html.Div([
          html.H3("Water Quality", style={'textAlign': 'center','color': '#7ec1fd'}),
@@ -285,11 +389,12 @@ app.layout = html.Div([
                                      value='3 Hours', clearable=False, style={'width': '200px'})
                     ], style={'flex': 1})
                 ], style={'display': 'flex', 'justifyContent': 'space-between', 'alignItems': 'center', 'marginBottom': '20px'}),
-                dcc.Graph(id="graph", style={'height': '600px'})
+                dcc.Graph(id="graph", style={'height': '600px'}),
+                html.Div(id='rolling-stats', style={'marginTop': '10px'})
             ], style={'width': '48%', 'display': 'inline-block', 'verticalAlign': 'top'}),
             html.Div([
-                html.H3("Suman Nagar, Haridwar Map", style={'textAlign': 'center'}),
-                html.Iframe(id='map-iframe', srcDoc=create_map().get_root().render(), 
+                html.H3(f"{SITES[DEFAULT_SITE].title} Map", id='map-title', style={'textAlign': 'center'}),
+                html.Iframe(id='map-iframe', src=f'/maps/{map_artifacts[DEFAULT_SITE]}', 
                             style={'width': '100%', 'height': '600px', 'border': '1px solid #ddd', 'borderRadius': '5px'})
             ], style={'width': '48%', 'display': 'inline-block', 'verticalAlign': 'top', 'marginLeft': '4%'})
         ], style={'display': 'flex', 'justifyContent': 'space-between'}),
@@ -299,59 +404,89 @@ app.layout = html.Div([
                 html.Label("Select Date Range:"),
                 dcc.DatePickerRange(id='date-picker-range', start_date=datetime.now().date() - timedelta(days=7),
                                     end_date=datetime.now().date(), display_format='YYYY-MM-DD'),
-                html.Button('View Data', id='view-data-button', n_clicks=0, style={'marginLeft': '10px'})
+                html.Button('View Data', id='view-data-button', n_clicks=0, style={'marginLeft': '10px'}),
+                dcc.Dropdown(id='history-column', options=COLUMNS, value='source_TDS', clearable=False,
+                             style={'width': '200px', 'display': 'inline-block', 'marginLeft': '10px',
+                                    'verticalAlign': 'middle'})
             ], style={'marginBottom': '20px'}),
+            dcc.Graph(id='history-graph', style={'height': '450px'}),
             dash_table.DataTable(id='historical-data-table', columns=[{"name": i, "id": i} for i in COLUMNS + ['timestamp']],
-                                 page_size=10, style_table={'overflowX': 'auto'}),
-            html.Button('Download CSV', id='download-csv-button', n_clicks=0, style={'marginTop': '10px'}),
-            dcc.Download(id="download-dataframe-csv"),
+                                 page_current=0, page_size=10, page_count=1, page_action='custom',
+                                 sort_action='custom', sort_mode='multi', sort_by=[],
+                                 filter_action='custom', filter_query='',
+                                 style_table={'overflowX': 'auto'}),
+            html.Div([
+                html.A(html.Button('Download CSV'), id='download-csv-link', href='', download=''),
+                html.A(html.Button('Download Parquet', style={'marginLeft': '10px'}),
+                       id='download-parquet-link', href='', download=''),
+            ], style={'marginTop': '10px'}),
         ]),
+        # Fallback poll, switched off by assets/live-updates.js while the event stream is connected
         dcc.Interval(id='interval-component', interval=60000, n_intervals=0),
-        dcc.Store(id='historical-data-store')
+        dcc.Store(id='live-site'),
+        dcc.Store(id='live-data'),
+        dcc.Store(id='live-window'),
+        dcc.Store(id='live-cursor'),
+        dcc.Store(id='graph-config', data=graph_config()),
+        dcc.Store(id='historical-data-store'),
+        dcc.Store(id='history-window')
     ], style={'maxWidth': '1200px', 'margin': '0 auto', 'padding': '0 20px'}),
     create_footer()
 ], style={'fontFamily': 'Arial, sans-serif', 'backgroundColor': '#f9f9f9'})
 
 # Dash callbacks
+@app.callback(
+    [Output('site-name', 'children'),
+     Output('map-title', 'children'),
+     Output('map-iframe', 'src'),
+     Output('live-site', 'data')],
+    [Input('url', 'pathname')]
+)
+def update_site(pathname):
+    site = resolve_site(pathname)
+    if site is None:
+        return "Unknown site", "", "", None
+    return site.name, f"{site.title} Map", f"/maps/{map_artifacts[site.slug]}", site.slug
+
+# (Re)subscribe the browser to the site's event stream
+app.clientside_callback(
+    ClientsideFunction(namespace='live', function_name='subscribe'),
+    Output('live-site', 'modified_timestamp'),
+    Input('live-site', 'data')
+)
+
 @app.callback(
     [Output('error-message', 'children')] +
     [Output(f'source-{param.lower()}', 'children') for param in ['pH', 'TDS', 'FRC', 'pressure', 'flow']] +
-    [Output('graph', 'figure')],
+    [Output('live-window', 'data'),
+     Output('live-cursor', 'data')],
     [Input('interval-component', 'n_intervals'),
-     Input('dist_column', 'value'),
-     Input('time_duration', 'value')]
+     Input('live-data', 'data'),
+     Input('url', 'pathname')],
+    [State('live-cursor', 'data')]
 )
-def update_dashboard(n, selected_column, selected_duration):
+def update_dashboard(n, live, pathname, cursor):
+    # The graph itself is drawn clientside from 'live-window' (see assets/graph.js)
     try:
-        data = fetch_data_from_api(API_URL)
-        df = process_data(data)
+        site = resolve_site(pathname)
+        if site is None:
+            return ["Unknown site."] + ["N/A"] * 5 + [None, None]
+        snapshot = ingestors.get(site.slug)
+        series = snapshot.series
         
-        if df.empty:
-            return ["No data available. Please check the API connection."] + ["N/A"] * 5 + [go.Figure()]
+        if series.empty:
+            return ["No data available. Please check the API connection."] + ["N/A"] * 5 + [None, None]
 
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        end_time = df['timestamp'].max()
-        start_time = end_time - TIME_DURATIONS[selected_duration]
-        df_filtered = df[(df['timestamp'] >= start_time) & (df['timestamp'] <= end_time)]
+        # Enough history for the longest duration; after the first send the browser's copy is
+        # only patched with the new readings (and nothing is sent when there are none)
+        with metrics.timed('filter_seconds', stage='live_window'):
+            window, cursor = live_window(series, COLUMNS, max(TIME_DURATIONS.values()),
+                                         f"{site.slug}/{snapshot.generation}/{snapshot.backfilled}", cursor)
+        if window is dash.no_update:
+            # Nothing new since the browser's copy, so the value boxes are current as well
+            return [dash.no_update] * 8
 
-        fig = go.Figure()
-        fig.add_trace(go.Scatter(x=df_filtered['timestamp'], y=df_filtered[selected_column], mode='lines+markers', line=dict(color='green')))
-        
-        y_min, y_max = Y_RANGES.get(selected_column, [None, None])
-        
-        fig.update_layout(
-            title=f'{selected_column} Vs {selected_duration}',
-            xaxis_title='Time (hrs)', 
-            yaxis_title=f'{selected_column} ({UNITS[selected_column.split("_")[1]]})', 
-            yaxis=dict(range=[y_min, y_max]),
-            height=600, 
-            margin=dict(l=50, r=50, t=50, b=50),
-            paper_bgcolor='rgba(0,0,0,0)', 
-            plot_bgcolor='rgba(0,0,0,0)', 
-            font=dict(size=14)
-        )
-
-        latest = df.iloc[-1] if not df.empty else pd.Series()
+        latest = series.latest()
         value_boxes = []
         for param in ['pH', 'TDS', 'FRC', 'pressure', 'flow']:
             value = latest.get(f'source_{param}', 'N/A')
@@ -362,52 +497,110 @@ def update_dashboard(n, selected_column, selected_duration):
                 html.Div(f"{value} {UNITS[param]}", style={'fontSize': '18px'})
             ]))
 
-        return [None] + value_boxes + [fig]
+        return [None] + value_boxes + [window, cursor]
     
     except Exception as e:
-        return [f"An error occurred: {str(e)}"] + ["Error"] * 5 + [go.Figure()]
+        metrics.inc('callback_errors_total', callback='update_dashboard')
+        return [f"An error occurred: {str(e)}"] + ["Error"] * 5 + [None, None]
+
+# Parameter and duration switching only re-slices the window in the browser
+app.clientside_callback(
+    ClientsideFunction(namespace='graph', function_name='figure'),
+    Output('graph', 'figure'),
+    [Input('live-window', 'data'),
+     Input('dist_column', 'value'),
+     Input('time_duration', 'value')],
+    [State('graph-config', 'data')]
+)
+
+@app.callback(
+    Output('rolling-stats', 'children'),
+    [Input('interval-component', 'n_intervals'),
+     Input('live-data', 'data'),
+     Input('url', 'pathname'),
+     Input('time_duration', 'value')]
+)
+def update_rolling_stats(n, live, pathname, duration):
+    # Maintained per sample by the ingestor (see rolling.RollingStats); this is only a lookup
+    try:
+        site = resolve_site(pathname)
+        if site is None:
+            return None
+        rolling = ingestors.get(site.slug).rolling
+        if duration not in rolling.index.get_level_values('window'):
+            return None
+        table = rolling.loc[duration]
+
+        def cell(value, digits=2):
+            return html.Td("N/A" if pd.isna(value) else f"{value:.{digits}f}", style={'padding': '4px 8px'})
+
+        header = ['Parameter', 'Mean', 'Min', 'Max', 'Std', 'Outside range']
+        rows = []
+        for param in QUALITY_PARAMETERS:
+            stats = table.loc[param]
+            name = param.split('_')[1]
+            outside = stats['outside_percent']
+            # FRC is in hundredths of a ppm
+            digits = 3 if name == 'FRC' else 2
+            rows.append(html.Tr([
+                html.Td(f"{name} {UNITS[name]}".strip(), style={'padding': '4px 8px'}),
+                *(cell(stats[column], digits) for column in ['mean', 'min', 'max', 'std']),
+                html.Td("N/A" if pd.isna(outside) else
+                        f"{format_timedelta(timedelta(seconds=stats['outside_seconds']))} ({outside:.0f}%)",
+                        style={'padding': '4px 8px'}),
+            ]))
+        return html.Table([
+            html.Caption(f"Last {duration}", style={'fontWeight': 'bold', 'marginBottom': '5px'}),
+            html.Thead(html.Tr([html.Th(h, style={'padding': '4px 8px'}) for h in header])),
+            html.Tbody(rows)
+        ], style={'width': '100%', 'borderCollapse': 'collapse', 'textAlign': 'center'})
+
+    except Exception as e:
+        metrics.inc('callback_errors_total', callback='update_rolling_stats')
+        print(f"Error updating rolling statistics: {str(e)}")
+        return None
     
 @app.callback(
     [Output('daily-total-flow', 'children'),
      Output('daily-pumping-hours', 'children'),
      Output('daily-lpcd', 'children'),
      Output('weekly-lpcd', 'children')],
-    [Input('interval-component', 'n_intervals')]
+    [Input('interval-component', 'n_intervals'),
+     Input('live-data', 'data'),
+     Input('url', 'pathname')]
 )
-def update_additional_metrics(n):
+def update_additional_metrics(n, live, pathname):
     try:
-        data = fetch_data_from_api(API_URL)
-        df = process_data(data)
+        site = resolve_site(pathname)
+        if site is None:
+            return ["N/A"] * 4
+        daily = ingestors.get(site.slug).daily
         
-        if df.empty:
+        if daily.empty:
             return ["N/A"] * 4
 
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        today = datetime.now().date()
-        
-        # Filter data for today
-        df_today = df[df['timestamp'].dt.date == today]
+        today = pd.Timestamp(datetime.now().date())
         
-        if df_today.empty:
+        # Look up today's rollup row
+        if today not in daily.index or daily.at[today, 'samples'] == 0:
             return ["No data for today"] * 4
+        day = daily.loc[today]
 
         # Calculate daily total flow
-        daily_total_flow = df_today['source_flow'].sum()
+        daily_total_flow = day['flow_sum']
         
         # Calculate daily pumping hours
-        df_today['is_pumping'] = df_today['source_flow'] > 0
-        daily_pumping_hours = df_today['is_pumping'].sum() / 6  # Assuming data is collected every 10 minutes
+        daily_pumping_hours = day['pumping_seconds'] / 3600
         
         # Calculate LPCD
-        population = 10000  # Adjust this value as needed
-        daily_flow = df_today['source_flow'].sum() * 1000  # Convert to liters
-        daily_lpcd = daily_flow / population if population > 0 else 0
+        population = site.population
+        sampled = daily[daily['samples'] > 0]
+        lpcd = calculate_lpcd(sampled, population) if population > 0 else pd.Series(0.0, index=sampled.index)
+        daily_lpcd = lpcd[today]
         
         # Calculate weekly LPCD
         one_week_ago = today - timedelta(days=7)
-        df_week = df[(df['timestamp'].dt.date > one_week_ago) & (df['timestamp'].dt.date <= today)]
-        weekly_flow = df_week.groupby(df_week['timestamp'].dt.date)['source_flow'].sum() * 1000  # Convert to liters
-        weekly_lpcd = (weekly_flow / population).mean() if population > 0 else 0
+        weekly_lpcd = lpcd[(lpcd.index > one_week_ago) & (lpcd.index <= today)].mean()
 
         return [
             html.Div([
@@ -429,48 +622,96 @@ def update_additional_metrics(n):
         ]
     
     except Exception as e:
+        metrics.inc('callback_errors_total', callback='update_additional_metrics')
         print(f"Error updating additional metrics: {str(e)}")
         return ["Error"] * 4    
 
 @app.callback(
     Output('historical-data-store', 'data'),
-    [Input('view-data-button', 'n_clicks')],
+    [Input('view-data-button', 'n_clicks'),
+     Input('url', 'pathname')],
     [State('date-picker-range', 'start_date'),
      State('date-picker-range', 'end_date')]
 )
-def fetch_historical_data(n_clicks, start_date, end_date):
-    if n_clicks > 0:
-        try:
-            data = fetch_data_from_api(API_URL)
-            df = process_data(data)
-            
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-            mask = (df['timestamp'].dt.date >= pd.to_datetime(start_date).date()) & \
-                   (df['timestamp'].dt.date <= pd.to_datetime(end_date).date())
-            filtered_df = df.loc[mask]
-            
-            return filtered_df.to_dict('records')
-        except Exception as e:
-            print(f"Error fetching historical data: {str(e)}")
-            return []
-    return []
+def fetch_historical_data(n_clicks, pathname, start_date, end_date):
+    # Only the selected range goes to the browser; rows are paged in by update_table
+    site = resolve_site(pathname)
+    if n_clicks > 0 and site is not None:
+        return {'site': site.slug, 'start_date': start_date, 'end_date': end_date}
+    return None
 
 @app.callback(
-    Output('historical-data-table', 'data'),
-    [Input('historical-data-store', 'data')]
+    Output('history-window', 'data'),
+    [Input('historical-data-store', 'data'),
+     Input('history-column', 'value')]
 )
-def update_table(data):
-    return data or []
+def update_history_window(selected_range, column):
+    # Raw rows for short ranges, hourly/daily/weekly min/mean/max for long ones; never more than
+    # MAX_GRAPH_POINTS buckets, so a year costs about as much as a day
+    if not selected_range:
+        return None
+    try:
+        snapshot = ingestors.get(selected_range['site'])
+        start, end = date_bounds(selected_range['start_date'], selected_range['end_date'])
+        with metrics.timed('filter_seconds', stage='history_levels'):
+            level, frame = query_history_levels(snapshot.series, snapshot.levels, start, end, [column])
+        return dict(history_series(level, frame, [column]), column=column)
+    except Exception as e:
+        metrics.inc('callback_errors_total', callback='update_history_window')
+        print(f"Error fetching history levels: {str(e)}")
+        return None
+
+app.clientside_callback(
+    ClientsideFunction(namespace='graph', function_name='history'),
+    Output('history-graph', 'figure'),
+    [Input('history-window', 'data')],
+    [State('graph-config', 'data')]
+)
+
+@app.callback(
+    [Output('historical-data-table', 'data'),
+     Output('historical-data-table', 'page_count'),
+     Output('historical-data-table', 'page_current')],
+    [Input('historical-data-store', 'data'),
+     Input('historical-data-table', 'page_current'),
+     Input('historical-data-table', 'page_size'),
+     Input('historical-data-table', 'sort_by'),
+     Input('historical-data-table', 'filter_query')]
+)
+def update_table(selected_range, page_current, page_size, sort_by, filter_query):
+    # A new range starts from its first page; the old page number may be past its end
+    new_range = dash.ctx.triggered_id == 'historical-data-store'
+    page = 0 if new_range else dash.no_update
+    if not selected_range:
+        return [], 1, page
+    try:
+        df = ingestors.get(selected_range['site']).df
+        with metrics.timed('filter_seconds', stage='history_page'):
+            dff = query_history(df, selected_range['start_date'], selected_range['end_date'], filter_query, sort_by)
+            records, page_count = page_records(dff[[col for col in COLUMNS + ['timestamp'] if col in dff.columns]],
+                                               0 if new_range else page_current, page_size)
+            return records, page_count, page
+    except Exception as e:
+        metrics.inc('callback_errors_total', callback='update_table')
+        print(f"Error fetching historical data: {str(e)}")
+        return [], 1, page
 
 @app.callback(
-    Output("download-dataframe-csv", "data"),
-    [Input("download-csv-button", "n_clicks")],
-    [State('historical-data-store', 'data')]
+    [Output('download-csv-link', 'href'),
+     Output('download-parquet-link', 'href')],
+    [Input('historical-data-store', 'data'),
+     Input('historical-data-table', 'filter_query')]
 )
-def download_csv(n_clicks, data):
-    if n_clicks > 0 and data:
-        df = pd.DataFrame(data)
-        return dcc.send_data_frame(df.to_csv, "historical_data.csv", index=False)
+def update_download_links(selected_range, filter_query):
+    # Downloads are streamed by the /export/historical route, not sent through a callback
+    if not selected_range:
+        return '', ''
+    params = {'site': selected_range['site'], 'start_date': selected_range['start_date'],
+              'end_date': selected_range['end_date']}
+    if filter_query:
+        params['filter'] = filter_query
+    return (f"/export/historical?{urlencode(dict(params, format='csv'))}",
+            f"/export/historical?{urlencode(dict(params, format='parquet'))}")
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8080))
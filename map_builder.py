@@ -0,0 +1,187 @@
+import hashlib
+import os
+import re
+import tempfile
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+MAP_DIR = os.environ.get('MAP_DIR', 'map_cache')
+TDS_COLUMN = 'Total Dissolved Solids (TDS)'
+# Artifact names from before the site registry: map-<hash>.html, one map for the only site
+_LEGACY_ARTIFACT = re.compile(r'map-[0-9a-f]{16}\.html')
+
+
+# Each site's folium map is rendered once into a static HTML file whose name
+# carries the site slug and a hash of its inputs (GeoJSON, Excel workbook,
+# sheet and boundary names and this module). Workers only hash the inputs at
+# startup and serve the existing file by URL; geopandas and folium are
+# imported only when an artifact actually has to be (re)built.
+
+def map_artifact_name(site):
+    digest = hashlib.sha256()
+    for path in (site.geojson_path, site.excel_path, __file__):
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    digest.update(f"{site.excel_sheet}\0{site.boundary_name}".encode('utf-8'))
+    return f"map-{site.slug}-{digest.hexdigest()[:16]}.html"
+
+
+def ensure_map_artifact(site, map_dir=MAP_DIR):
+    name = map_artifact_name(site)
+    path = os.path.join(map_dir, name)
+    if not os.path.exists(path):
+        os.makedirs(map_dir, exist_ok=True)
+        html = create_map(site).get_root().render()
+        fd, tmp_path = tempfile.mkstemp(dir=map_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(html)
+        os.replace(tmp_path, path)
+        # Older artifacts of this site (and unprefixed single-site ones) are no longer referenced by any
+        # layout; without a preloaded app every worker rebuilds, so another one may have removed them already
+        for entry in os.listdir(map_dir):
+            if entry != name and (entry.rsplit('-', 1)[0] == f"map-{site.slug}" or _LEGACY_ARTIFACT.fullmatch(entry)):
+                try:
+                    os.remove(os.path.join(map_dir, entry))
+                except FileNotFoundError:
+                    pass
+    return name
+
+
+# Load GeoJSON data
+@lru_cache(maxsize=None)
+def load_geojson(path):
+    import geopandas as gpd
+    return gpd.read_file(path)
+
+# Load and process Excel data
+@lru_cache(maxsize=None)
+def load_excel_data(path, sheet):
+    import geopandas as gpd
+    df = pd.read_excel(path, sheet_name=sheet)
+    return gpd.GeoDataFrame(
+        df, geometry=gpd.points_from_xy(df.Longitude, df.Latitude), crs="EPSG:4326"
+    )
+
+
+def tds_colormap(points):
+    from branca.colormap import LinearColormap
+    return LinearColormap(
+        colors=['green', 'yellow', 'red'],
+        vmin=points[TDS_COLUMN].min(),
+        vmax=points[TDS_COLUMN].max(),
+        caption='Total Dissolved Solids (TDS)'
+    )
+
+
+def survey_points_layer(excel_gdf, colormap):
+    # Village, marker colour and popup HTML of every survey point, computed column-wise
+    points = excel_gdf.to_crs(epsg=4326)
+    tds = points[TDS_COLUMN].to_numpy(dtype=float)
+    colors = np.array([[c[i] for c in colormap.colors] for i in range(3)])
+    rgb = np.stack([np.interp(tds, colormap.index, channel) for channel in colors], axis=1)
+    hex_colors = pd.Series(np.round(rgb * 255).astype(int).tolist()).map(lambda c: '#%02x%02x%02x' % tuple(c))
+
+    popup = ("Village: " + points['Village'].astype(str) + "<br>"
+             "pH: " + points['pH'].astype(str) + "<br>"
+             "TDS: " + points[TDS_COLUMN].astype(str) + " mg/L<br>"
+             "FRC: " + points['Free Residual Chlorine (FRC)'].astype(str) + " mg/L<br>"
+             "Altitude: " + points['Altitude'].astype(str) + " m<br>"
+             "Pressure: " + points['Pressure'].astype(str) + " (bar)<br>"
+             "Tap Flow Rate: " + points['Tap Flow Rate'].astype(str) + " (m3)<br>")
+    return points[['Village', 'geometry']].assign(color=hex_colors.to_numpy(), popup=popup.to_numpy())
+
+
+# Survey points and boundaries are not inlined: the map fetches what is in view
+# from /geo/<slug>/<layer> after every move, and a click anywhere else asks
+# /geo/<slug>/lookup for the nearest sample and the boundary around it.
+SURVEY_LAYERS_TEMPLATE = """
+{% macro script(this, kwargs) %}
+(function() {
+    var map = {{ this._parent.get_name() }};
+    var base = {{ this.base_url|tojson }};
+    var samples = L.geoJson(null, {
+        pointToLayer: function(feature, latlng) {
+            var color = feature.properties.color;
+            return L.circleMarker(latlng, {radius: 3, fill: true, fillOpacity: 1, weight: 2, color: color,
+                                           fillColor: color, bubblingMouseEvents: false});
+        },
+        onEachFeature: function(feature, layer) {
+            layer.bindTooltip(String(feature.properties.Village));
+            layer.bindPopup(feature.properties.popup, {maxWidth: 300});
+        }
+    }).addTo(map);
+    var boundaries = L.geoJson(null, {
+        style: {fillColor: 'blue', color: 'black', weight: 2, fillOpacity: 0.1},
+        onEachFeature: function(feature, layer) {
+            layer.bindTooltip('Name: ' + feature.properties.Name);
+        }
+    }).addTo(map);
+    var overlays = {'TDS Data': samples};
+    overlays[{{ this.boundary_name|tojson }}] = boundaries;
+    L.control.layers(null, overlays).addTo(map);
+
+    // A response that arrives after a newer request for the same layer is dropped
+    var latest = {};
+    function load(layer, name) {
+        var bounds = map.getBounds();
+        var id = latest[name] = (latest[name] || 0) + 1;
+        var bbox = [bounds.getWest(), bounds.getSouth(), bounds.getEast(), bounds.getNorth()].join(',');
+        fetch(base + '/' + name + '?bbox=' + bbox + '&zoom=' + map.getZoom())
+            .then(function(response) { return response.json(); })
+            .then(function(data) {
+                if (id === latest[name]) {
+                    layer.clearLayers();
+                    layer.addData(data);
+                }
+            });
+    }
+    function refresh() {
+        load(samples, 'samples');
+        load(boundaries, 'boundaries');
+    }
+    map.on('moveend', refresh);
+    refresh();
+
+    map.on('click', function(e) {
+        fetch(base + '/lookup?lon=' + e.latlng.lng + '&lat=' + e.latlng.lat)
+            .then(function(response) { return response.json(); })
+            .then(function(data) {
+                var names = data.boundaries.map(function(b) { return b.Name; });
+                var html = names.length ? 'Boundary: ' + names.join(', ') + '<br>' : 'Outside the boundaries<br>';
+                if (data.nearest) {
+                    html += '<br>Nearest sample (' + Math.round(data.nearest.distance_m) + ' m away):<br>' +
+                            data.nearest.popup;
+                }
+                L.popup({maxWidth: 300}).setLatLng(e.latlng).setContent(html).openOn(map);
+            });
+    });
+})();
+{% endmacro %}
+"""
+
+
+def survey_layers(site):
+    from branca.element import MacroElement
+    from jinja2 import Template
+
+    element = MacroElement()
+    element._name = 'SurveyLayers'
+    element._template = Template(SURVEY_LAYERS_TEMPLATE)
+    element.base_url = f"/geo/{site.slug}"
+    element.boundary_name = site.boundary_name or site.name
+    return element
+
+
+def create_map(site):
+    import folium
+
+    excel_gdf_4326 = load_excel_data(site.excel_path, site.excel_sheet).to_crs(epsg=4326)
+    map_center = [excel_gdf_4326.geometry.y.mean(), excel_gdf_4326.geometry.x.mean()]
+    m = folium.Map(location=map_center, zoom_start=14)
+
+    survey_layers(site).add_to(m)
+    tds_colormap(excel_gdf_4326).add_to(m)
+
+    return m
@@ -0,0 +1,300 @@
+import glob
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # No flock on Windows: files of exited workers are kept instead of folded
+    fcntl = None
+
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'suman_nagar_metrics'))
+# How often a process writes its metrics for the others to aggregate
+FLUSH_INTERVAL = 5.0
+PREFIX = 'dashboard_'
+# Totals of exited workers, and the worker files already added to them
+RETIRED_FILE = 'retired.json'
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = (1e3, 1e4, 5e4, 1e5, 5e5, 1e6, 5e6, 1e7, 5e7)
+
+# name: (type, help, buckets). Every metric has to be declared here.
+METRICS = {
+    'api_token_requests_total': ('counter', 'Token requests sent to the sensor API', None),
+    'api_token_seconds': ('histogram', 'Time to obtain an API token', SECONDS_BUCKETS),
+    'api_fetch_seconds': ('histogram', 'Time for one sensor data request, including download and parsing',
+                          SECONDS_BUCKETS),
+    'api_received_bytes': ('histogram', 'Size of sensor data responses as transferred (compressed if gzip)',
+                           BYTES_BUCKETS),
+    'api_errors_total': ('counter', 'Failed token or data requests', None),
+    'process_data_seconds': ('histogram', 'Time spent turning API records into a typed frame', SECONDS_BUCKETS),
+    'process_data_rows_total': ('counter', 'Records processed', None),
+    'store_append_seconds': ('histogram', 'Time spent appending new rows to a store', SECONDS_BUCKETS),
+    'store_rows_appended_total': ('counter', 'Rows appended to the stores', None),
+    'ingest_refresh_seconds': ('histogram', 'Time for one site refresh (sync, fetch, process and publish)', SECONDS_BUCKETS),
+    'ingest_errors_total': ('counter', 'Failed refreshes', None),
+    'filter_seconds': ('histogram', 'Time spent selecting and preparing rows for a callback or export', SECONDS_BUCKETS),
+    'callback_seconds': ('histogram', 'Total time of a Dash callback request', SECONDS_BUCKETS),
+    'callback_response_bytes': ('histogram', 'Serialized size of a Dash callback response', BYTES_BUCKETS),
+    'callback_errors_total': ('counter', 'Callbacks that ended in their error branch', None),
+}
+
+
+class Registry:
+    """Counters and histograms of one process.
+
+    Every process writes its values to METRICS_DIR/<pid>-<random>.json, at
+    most every FLUSH_INTERVAL seconds, and holds an flock on the matching
+    .lock file for as long as it lives. render() adds up the files of all
+    processes, so whichever gunicorn worker answers /metrics reports the whole
+    server. It first folds the files whose lock is free (their worker has
+    exited) into RETIRED_FILE, so counters never go backwards, a recycled PID
+    cannot overwrite anything and the directory does not grow with every
+    worker ever started.
+    """
+
+    def __init__(self, path=METRICS_DIR):
+        self.path = path
+        self._lock = threading.Lock()
+        self._values = {}
+        self._pid = os.getpid()
+        self._name = _process_name()
+        self._lock_file = None
+        self._flushed_at = 0.0
+
+    def inc(self, name, value=1, **labels):
+        self._update(name, labels, lambda entry: entry + value, 0)
+
+    def observe(self, name, value, **labels):
+        buckets = METRICS[name][2]
+
+        def add(entry):
+            entry['count'] += 1
+            entry['sum'] += value
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    entry['buckets'][i] += 1
+            return entry
+
+        self._update(name, labels, add, None)
+
+    @contextmanager
+    def timed(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def flush(self):
+        with self._lock:
+            self._check_fork()
+            data = [[name, labels, value] for (name, labels), value in self._values.items()]
+            name = self._name
+            self._flushed_at = time.monotonic()
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            self._hold_lock(name)
+            _write_json(os.path.join(self.path, f"{name}.json"), data, self.path)
+        except OSError as e:
+            print(f"Could not write metrics: {e}")
+
+    def render(self):
+        self.flush()
+        merged = {}
+        # Read under the same lock as the folding, so no worker is missed while its file moves
+        with self._retired_lock():
+            if fcntl is not None:
+                try:
+                    self._retire()
+                except OSError as e:
+                    print(f"Could not fold metrics of exited workers: {e}")
+            retired = _read_retired(self.path)
+            files = [_read_json(path) or [] for path in self._worker_files()
+                     if _file_name(path) not in retired['folded']]
+        for entries in [retired['values']] + files:
+            for name, labels, value in entries:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                merged[key] = _merge(merged.get(key), value)
+        return _exposition(merged)
+
+    @contextmanager
+    def _retired_lock(self):
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, 'retired.lock'), 'a') as guard:
+            fcntl.flock(guard, fcntl.LOCK_EX)
+            yield
+
+    def _retire(self):
+        # Add the files of exited workers to RETIRED_FILE, then delete them; needs _retired_lock()
+        retired = _read_retired(self.path)
+        folded = set(retired['folded'])
+        totals = {(name, tuple(tuple(pair) for pair in labels)): value
+                  for name, labels, value in retired['values']}
+        for path in self._worker_files():
+            name = _file_name(path)
+            if name == self._name or name in folded or not self._exited(name):
+                continue
+            entries = _read_json(path)
+            if entries is None:
+                continue
+            for metric, labels, value in entries:
+                key = (metric, tuple(tuple(pair) for pair in labels))
+                totals[key] = _merge(totals.get(key), value)
+            folded.add(name)
+        if not folded:
+            return
+        values = [[metric, [list(pair) for pair in labels], value] for (metric, labels), value in totals.items()]
+        # The totals are saved (with the names they include) before the files go, so a crash
+        # in between can not count a worker twice
+        _write_json(os.path.join(self.path, RETIRED_FILE), {'values': values, 'folded': sorted(folded)},
+                    self.path)
+        for name in folded:
+            for suffix in ('.json', '.lock'):
+                try:
+                    os.remove(os.path.join(self.path, name + suffix))
+                except FileNotFoundError:
+                    pass
+        _write_json(os.path.join(self.path, RETIRED_FILE), {'values': values, 'folded': []}, self.path)
+
+    def _exited(self, name):
+        # A worker holds the lock on its file until it exits; files without one predate the locks
+        try:
+            f = open(os.path.join(self.path, f"{name}.lock"), 'r')
+        except FileNotFoundError:
+            return True
+        with f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return False
+            fcntl.flock(f, fcntl.LOCK_UN)
+            return True
+
+    def _worker_files(self):
+        return [path for path in glob.glob(os.path.join(self.path, '*.json'))
+                if os.path.basename(path) != RETIRED_FILE]
+
+    def _hold_lock(self, name):
+        if fcntl is None or self._lock_file is not None:
+            return
+        f = open(os.path.join(self.path, f"{name}.lock"), 'a')
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._lock_file = f
+
+    def _check_fork(self):
+        # Called with self._lock held. In a forked child the values, file and lock are the parent's
+        if self._pid == os.getpid():
+            return
+        self._values = {}
+        self._pid = os.getpid()
+        self._name = _process_name()
+        if self._lock_file is not None:
+            # Closing our copy leaves the parent's lock in place
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _update(self, name, labels, update, initial):
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self._check_fork()
+            if key not in self._values:
+                self._values[key] = initial if initial is not None else _empty_histogram(name)
+            self._values[key] = update(self._values[key])
+            due = time.monotonic() - self._flushed_at >= FLUSH_INTERVAL
+        if due:
+            self.flush()
+
+
+def _process_name():
+    # Unique even when the OS hands out a PID again
+    return f"{os.getpid()}-{uuid.uuid4().hex[:12]}"
+
+
+def _file_name(path):
+    return os.path.basename(path)[:-len('.json')]
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _read_retired(path):
+    return _read_json(os.path.join(path, RETIRED_FILE)) or {'values': [], 'folded': []}
+
+
+def _write_json(path, data, directory):
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _empty_histogram(name):
+    return {'count': 0, 'sum': 0.0, 'buckets': [0] * len(METRICS[name][2])}
+
+
+def _merge(total, value):
+    if total is None:
+        return value
+    if isinstance(value, dict):
+        return {'count': total['count'] + value['count'], 'sum': total['sum'] + value['sum'],
+                'buckets': [a + b for a, b in zip(total['buckets'], value['buckets'])]}
+    return total + value
+
+
+def _exposition(merged):
+    # Prometheus text format, version 0.0.4
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        series = sorted((labels, value) for (metric, labels), value in merged.items() if metric == name)
+        if not series:
+            continue
+        full_name = PREFIX + name
+        lines.append(f"# HELP {full_name} {help_text}")
+        lines.append(f"# TYPE {full_name} {kind}")
+        for labels, value in series:
+            if kind == 'counter':
+                lines.append(f"{full_name}{_labels(labels)} {_number(value)}")
+                continue
+            for bound, count in zip(buckets, value['buckets']):
+                lines.append(f"{full_name}_bucket{_labels(labels + (('le', _number(bound)),))} {count}")
+            lines.append(f"{full_name}_bucket{_labels(labels + (('le', '+Inf'),))} {value['count']}")
+            lines.append(f"{full_name}_sum{_labels(labels)} {_number(value['sum'])}")
+            lines.append(f"{full_name}_count{_labels(labels)} {value['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    pairs = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{key}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _number(value):
+    if isinstance(value, float) and math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = Registry()
+inc = registry.inc
+observe = registry.observe
+timed = registry.timed
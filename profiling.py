@@ -0,0 +1,37 @@
+import cProfile
+import io
+import os
+import pstats
+import time
+
+# Per-request profiling, for finding out whether a slow request is spent in
+# the API client, pandas or Plotly. Only when PROFILE_REQUESTS is true is a
+# request with an `X-Profile: 1` header run under cProfile. The stats are
+# written to PROFILE_DIR and the top functions are printed.
+PROFILE_REQUESTS = os.environ.get('PROFILE_REQUESTS', 'False').lower() == 'true'
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_HEADER = 'X-Profile'
+PROFILE_TOP = 20
+
+
+def wants_profile(headers):
+    return PROFILE_REQUESTS and headers.get(PROFILE_HEADER, '').lower() in ('1', 'true')
+
+
+def start_profile():
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def finish_profile(profiler, label):
+    # Returns the path of the saved .prof file (open it with pstats or snakeviz)
+    profiler.disable()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    safe_label = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in label)[:80]
+    path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{safe_label}.prof")
+    profiler.dump_stats(path)
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(PROFILE_TOP)
+    print(f"Profile of {label} saved to {path}\n{summary.getvalue()}")
+    return path
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+DAY = np.timedelta64(1, 'D')
+
+
+# Vectorized pumping analysis shared by the dashboard metrics.
+#
+# A pumping run starts at the first sample with source_flow > 0 and ends at the
+# next sample with source_flow == 0 (or at the last sample if the pump is still
+# running). Samples with a missing flow keep the previous state. Runs are timed
+# from the actual timestamps and split at midnight, so a run from 23:30 to
+# 00:40 adds 30 minutes to one day and 40 minutes to the next.
+
+def pump_state(flow, initial=False):
+    # True where the pump is running; missing readings keep the last known state
+    state = np.where(flow > 0, 1.0, np.where(flow == 0, 0.0, np.nan))
+    state = np.concatenate([[1.0 if initial else 0.0], state])
+    known = np.where(np.isnan(state), 0, np.arange(len(state)))
+    np.maximum.accumulate(known, out=known)
+    return state[known][1:] == 1
+
+
+def pumping_intervals(df):
+    timestamps = df['timestamp'].to_numpy(dtype='datetime64[ns]')
+    flow = df['source_flow'].to_numpy(dtype=float)
+    n = len(flow)
+    if n == 0:
+        empty = np.array([], dtype='datetime64[ns]')
+        return empty, empty
+
+    on = pump_state(flow)
+    edges = np.diff(on.astype(np.int8), prepend=0, append=0)
+    start_idx = np.flatnonzero(edges == 1)
+    end_idx = np.minimum(np.flatnonzero(edges == -1), n - 1)
+    return timestamps[start_idx], timestamps[end_idx]
+
+
+def split_by_day(starts, ends):
+    # Cut every [start, end) interval at midnight; returns (day, seconds) per piece
+    first_day = starts.astype('datetime64[D]')
+    last_day = ends.astype('datetime64[D]')
+    pieces = (last_day - first_day).astype(np.int64) + 1
+    owner = np.repeat(np.arange(len(starts)), pieces)
+    offset = np.arange(len(owner)) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+    days = first_day[owner] + offset.astype('timedelta64[D]')
+    day_start = days.astype('datetime64[ns]')
+    piece_start = np.maximum(starts[owner], day_start)
+    piece_end = np.minimum(ends[owner], day_start + DAY)
+    seconds = (piece_end - piece_start) / np.timedelta64(1, 's')
+    return days, seconds
+
+
+def daily_pumping_summary(df):
+    # Per-day pumping seconds, flow sum over pumping samples and number of pump starts
+    columns = ['pumping_seconds', 'flow_sum', 'pump_starts']
+    if df.empty:
+        return pd.DataFrame(columns=columns, index=pd.DatetimeIndex([], name='date'))
+
+    starts, ends = pumping_intervals(df)
+    days, seconds = split_by_day(starts, ends)
+    pumping_seconds = pd.Series(seconds).groupby(days).sum()
+    pump_starts = pd.Series(1, index=starts.astype('datetime64[D]')).groupby(level=0).sum()
+
+    sample_days = df['timestamp'].to_numpy(dtype='datetime64[ns]').astype('datetime64[D]')
+    flow = df['source_flow'].to_numpy(dtype=float)
+    pumping = flow > 0
+    flow_sum = pd.Series(flow[pumping]).groupby(sample_days[pumping]).sum()
+
+    summary = pd.DataFrame({
+        'pumping_seconds': pumping_seconds,
+        'flow_sum': flow_sum,
+        'pump_starts': pump_starts
+    }).fillna(0)
+    summary['pump_starts'] = summary['pump_starts'].astype(np.int64)
+    summary.index = pd.DatetimeIndex(summary.index, name='date')
+    return summary[columns]
@@ -0,0 +1,163 @@
+import numpy as np
+import pandas as pd
+
+from downsample import MAX_GRAPH_POINTS
+from rollup import PARAMETERS, add_means
+from timeseries import catch_up
+
+# Bucket width of each level, finest first; weeks start on Monday
+LEVELS = {
+    'hour': np.timedelta64(1, 'h'),
+    'day': np.timedelta64(1, 'D'),
+    'week': np.timedelta64(7, 'D'),
+}
+_ORIGIN = np.datetime64('1970-01-05', 'ns')  # a Monday
+AGGREGATES = ['count', 'sum', 'min', 'max']
+# Readings are float32; this drops the noise digits of values like 302.70001220703125
+DECIMALS = 4
+
+
+class AggregatePyramid:
+    """Hourly, daily and weekly count/sum/min/max of every parameter, maintained as samples arrive.
+
+    `levels` maps a level name to a table indexed by bucket start. Like
+    DailyRollup, update() only aggregates the new samples and folds them into
+    the last bucket they extend; the tables and the dict are replaced, never
+    modified, so readers can hold on to them. Use query_history_levels() to
+    read from it.
+    """
+
+    def __init__(self, levels=LEVELS, parameters=PARAMETERS):
+        self.widths = {name: np.timedelta64(width, 'ns') for name, width in levels.items()}
+        self.parameters = list(parameters)
+        self.generation = None
+        self.high_water_mark = None
+        self.levels = {name: _empty_table(self.parameters) for name in self.widths}
+
+    def update(self, new_rows):
+        if self.high_water_mark is not None:
+            new_rows = new_rows[new_rows['timestamp'] > self.high_water_mark]
+        if new_rows.empty:
+            return self.levels
+        timestamps = new_rows['timestamp'].to_numpy(dtype='datetime64[ns]')
+        values = {param: new_rows[param].to_numpy(dtype=float) if param in new_rows
+                  else np.full(len(new_rows), np.nan) for param in self.parameters}
+        self.levels = {name: _merge(self.levels[name], _aggregate(timestamps, values, width))
+                       for name, width in self.widths.items()}
+        self.high_water_mark = new_rows['timestamp'].iloc[-1]
+        return self.levels
+
+    def sync(self, frame, generation=None):
+        return catch_up(self, frame, generation)
+
+    def rebuild(self, frame):
+        self.high_water_mark = None
+        self.levels = {name: _empty_table(self.parameters) for name in self.widths}
+        return self.update(frame)
+
+    def recompute_since(self, frame, start):
+        # Rows were backfilled from `start` on: aggregate every bucket from the one containing it again
+        timestamps = frame['timestamp'].to_numpy(dtype='datetime64[ns]')
+        start = np.datetime64(pd.Timestamp(start), 'ns')
+        levels = {}
+        for name, width in self.widths.items():
+            first = _bucket(start, width)
+            table = self.levels[name]
+            kept = table.iloc[:int(np.searchsorted(table.index.values, first, side='left'))]
+            lo = int(np.searchsorted(timestamps, first, side='left'))
+            if lo == len(frame):
+                levels[name] = kept
+                continue
+            rows = frame.iloc[lo:]
+            values = {param: rows[param].to_numpy(dtype=float) if param in rows
+                      else np.full(len(rows), np.nan) for param in self.parameters}
+            batch = _aggregate(timestamps[lo:], values, width)
+            levels[name] = pd.concat([kept, batch]) if not kept.empty else batch
+        self.levels = levels
+        return self.levels
+
+
+def query_history_levels(series, levels, start, end, parameters=PARAMETERS, max_points=MAX_GRAPH_POINTS):
+    """(level, frame) for [start, end) at the finest resolution that fits in max_points rows.
+
+    Tries the raw rows first, then each level from finest to coarsest, so a
+    day comes back raw, a month hourly and a year daily; if even the
+    coarsest level has too many buckets it is used anyway. Every answer costs
+    a few binary searches plus the rows returned. The frame has 'timestamp'
+    (bucket start) and <param>_count/_sum/_min/_mean/_max; raw rows have
+    min = mean = max = the reading.
+    """
+    raw = series.between(start, end, inclusive='left')
+    if len(raw) <= max_points or not levels:
+        return 'raw', _raw_buckets(raw, [p for p in parameters if p in raw.columns]).round(DECIMALS)
+    start, end = np.datetime64(pd.Timestamp(start), 'ns'), np.datetime64(pd.Timestamp(end), 'ns')
+    for name, table in levels.items():
+        # The bucket containing `start` counts if it reaches into the range
+        lo = max(int(np.searchsorted(table.index.values, start, side='right')) - 1, 0)
+        hi = int(np.searchsorted(table.index.values, end, side='left'))
+        if hi - lo <= max_points or name == list(levels)[-1]:
+            columns = [f'{param}_{agg}' for param in parameters for agg in AGGREGATES
+                       if f'{param}_{agg}' in table.columns]
+            return name, add_means(table.iloc[lo:hi][columns].reset_index(), parameters).round(DECIMALS)
+
+
+def _bucket(timestamps, width):
+    return _ORIGIN + (timestamps - _ORIGIN) // width * width
+
+
+def _aggregate(timestamps, values, width):
+    # Rows are time-ordered, so every bucket is one contiguous run and reduceat does the grouping
+    keys = _bucket(timestamps, width)
+    starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+    names, columns = [], []
+    for param, column in values.items():
+        valid = ~np.isnan(column)
+        names += [f'{param}_{agg}' for agg in AGGREGATES]
+        columns += [np.add.reduceat(valid.astype(float), starts),
+                    np.add.reduceat(np.where(valid, column, 0.0), starts),
+                    # fmin/fmax skip NaN, and give NaN only for a bucket without readings
+                    np.fmin.reduceat(column, starts),
+                    np.fmax.reduceat(column, starts)]
+    return pd.DataFrame(np.column_stack(columns), columns=names,
+                        index=pd.DatetimeIndex(keys[starts], name='timestamp'))
+
+
+def _merge(table, batch):
+    # Only the first new bucket can continue the last one in the table
+    if table.empty or batch.index[0] != table.index[-1]:
+        return pd.concat([table, batch]) if not table.empty else batch
+    last, values = table.iloc[-1].to_numpy(), batch.to_numpy(copy=True)
+    kind = batch.columns.str.rsplit('_', n=1).str[-1]
+    values[0] = np.where(kind == 'min', np.fmin(last, values[0]),
+                         np.where(kind == 'max', np.fmax(last, values[0]), last + values[0]))
+    return pd.concat([table.iloc[:-1], pd.DataFrame(values, index=batch.index, columns=batch.columns)])
+
+
+def _empty_table(parameters):
+    columns = [f'{param}_{agg}' for param in parameters for agg in AGGREGATES]
+    return pd.DataFrame({col: pd.Series(dtype=float) for col in columns},
+                        index=pd.DatetimeIndex([], name='timestamp'))
+
+
+def _raw_buckets(rows, parameters):
+    frame = {'timestamp': rows['timestamp'].to_numpy()}
+    for param in parameters:
+        values = rows[param].to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+        frame[f'{param}_count'] = valid.astype(float)
+        frame[f'{param}_sum'] = np.where(valid, values, 0.0)
+        for agg in ('min', 'mean', 'max'):
+            frame[f'{param}_{agg}'] = values
+    return pd.DataFrame(frame)
+
+
+def history_series(level, frame, parameters=PARAMETERS):
+    # JSON-ready min/mean/max lists per parameter over epoch-millisecond bucket starts, null when empty
+    t = frame['timestamp'].to_numpy().astype('datetime64[ms]').astype(np.int64)
+    values = {}
+    for param in parameters:
+        if f'{param}_mean' in frame:
+            values[param] = {agg: frame[f'{param}_{agg}'].astype(object).where(frame[f'{param}_{agg}'].notna(),
+                                                                                  None).tolist()
+                             for agg in ('min', 'mean', 'max')}
+    return {'level': level, 't': t.tolist(), 'y': values}
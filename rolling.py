@@ -0,0 +1,250 @@
+import math
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from data_process import widen_float32
+from timeseries import TimeSeries, catch_up
+
+QUALITY_PARAMETERS = ['source_pH', 'source_TDS', 'source_FRC', 'source_pressure']
+# A reading stands for the time until the next one, but for no longer than this,
+# so a sensor outage is counted neither inside nor outside the range
+MAX_SAMPLE_SPAN = pd.Timedelta(minutes=30)
+STAT_COLUMNS = ['count', 'mean', 'std', 'min', 'max', 'measured_seconds', 'outside_seconds', 'outside_percent']
+
+
+class RollingStats:
+    """Rolling mean, std, min, max and time outside a range for every window, kept up to date per sample.
+
+    `windows` maps a label to a duration (like the dashboard's TIME_DURATIONS),
+    `ranges` a parameter to its [low, high] limits. A window ends at the
+    latest sample and covers [latest - duration, latest], as TimeSeries.last()
+    does. Each new sample costs amortized O(1) per window and parameter: sums
+    are kept running and min/max come from monotonic deques, so nothing is
+    recomputed over the window. `table` is indexed by (window, parameter) and
+    replaced, never modified, on every update.
+    """
+
+    def __init__(self, windows, ranges, parameters=QUALITY_PARAMETERS, max_span=MAX_SAMPLE_SPAN):
+        self.windows = {label: pd.Timedelta(duration) for label, duration in windows.items()}
+        self.parameters = list(parameters)
+        self.bounds = [tuple(ranges[param]) if param in ranges else None for param in self.parameters]
+        self.max_span = pd.Timedelta(max_span).value
+        # Samples older than this (before the latest one) can no longer affect any window
+        self.horizon = max(self.windows.values(), default=pd.Timedelta(0)).value + self.max_span
+        self.generation = None
+        self._reset()
+
+    def update(self, new_rows):
+        # new_rows must be time-ordered; rows not newer than the high-water mark are ignored
+        if self.high_water_mark is not None:
+            new_rows = new_rows[new_rows['timestamp'] > self.high_water_mark]
+        if new_rows.empty:
+            return self.table
+        timestamps = new_rows['timestamp'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+        first = int(np.searchsorted(timestamps, timestamps[-1] - self.horizon, side='left'))
+        if first > 0:
+            # A long catch-up: everything before the horizon would only be pushed to be evicted
+            self._reset()
+            timestamps = timestamps[first:]
+            new_rows = new_rows.iloc[first:]
+        values = np.column_stack([widen_float32(new_rows[param].to_numpy()) if param in new_rows
+                                  else np.full(len(new_rows), np.nan) for param in self.parameters])
+        if self._open is None:
+            self._load(timestamps, values)
+        else:
+            for t, row in zip(timestamps.tolist(), values.tolist()):
+                self._push(t, row)
+        self.high_water_mark = new_rows['timestamp'].iloc[-1]
+        self.table = self._summarize()
+        return self.table
+
+    def sync(self, frame, generation=None):
+        return catch_up(self, frame, generation)
+
+    def rebuild(self, frame):
+        self._reset()
+        return self.update(TimeSeries(frame).last(pd.Timedelta(self.horizon)))
+
+    def recompute_since(self, frame, start):
+        # Rows backfilled from `start` on only matter if they fall within the horizon
+        if self.high_water_mark is not None and start < self.high_water_mark - pd.Timedelta(self.horizon):
+            return self.table
+        return self.rebuild(frame)
+
+    def _reset(self):
+        self._windows = {label: _Window(duration.value, len(self.parameters), self.bounds)
+                         for label, duration in self.windows.items()}
+        # (time, measured, outside) of the newest sample, whose span ends with the next one
+        self._open = None
+        self.high_water_mark = None
+        self.table = self._summarize()
+
+    def _push(self, t, values):
+        measured = [value == value for value in values]
+        outside = [ok and bounds is not None and not bounds[0] <= value <= bounds[1]
+                   for ok, value, bounds in zip(measured, values, self.bounds)]
+        if self._open is not None:
+            start, was_measured, was_outside = self._open
+            end = min(t, start + self.max_span)
+            for window in self._windows.values():
+                window.add_span(start, end, was_measured, was_outside)
+        for window in self._windows.values():
+            window.push(t, values)
+        self._open = (t, measured, outside)
+
+    def _load(self, timestamps, values):
+        # The state pushing every sample would leave, computed with NumPy (cold starts, rebuilds)
+        low = np.array([bounds[0] if bounds is not None else -np.inf for bounds in self.bounds])
+        high = np.array([bounds[1] if bounds is not None else np.inf for bounds in self.bounds])
+        measured = ~np.isnan(values)
+        outside = measured & ((values < low) | (values > high))
+        ends = np.minimum(timestamps[1:], timestamps[:-1] + self.max_span)
+        for window in self._windows.values():
+            window.load(timestamps, values, ends, measured, outside)
+        self._open = (int(timestamps[-1]), measured[-1].tolist(), outside[-1].tolist())
+
+    def _summarize(self):
+        labels, params, rows = [], [], []
+        for label, window in self._windows.items():
+            for i, param in enumerate(self.parameters):
+                labels.append(label)
+                params.append(param)
+                rows.append(window.summary(i))
+        return pd.DataFrame(rows, columns=STAT_COLUMNS, dtype=float,
+                            index=pd.MultiIndex.from_arrays([labels, params], names=['window', 'parameter']))
+
+
+class _Window:
+    # Running aggregates of every parameter over [latest - duration, latest]; times are int ns
+
+    def __init__(self, duration, n, bounds):
+        self.duration = duration
+        self.latest = None
+        # Sums are taken around the middle of the range to keep the variance numerically stable
+        self.shift = [(bound[0] + bound[1]) / 2 if bound is not None else 0.0 for bound in bounds]
+        self.samples = deque()
+        self.spans = deque()
+        self.count = [0] * n
+        self.total = [0.0] * n
+        self.squares = [0.0] * n
+        self.minima = [deque() for _ in range(n)]
+        self.maxima = [deque() for _ in range(n)]
+        self.measured = [0] * n
+        self.outside = [0] * n
+
+    def push(self, t, values):
+        for i, value in enumerate(values):
+            if value != value:
+                continue
+            self.count[i] += 1
+            delta = value - self.shift[i]
+            self.total[i] += delta
+            self.squares[i] += delta * delta
+            minima, maxima = self.minima[i], self.maxima[i]
+            while minima and minima[-1][1] >= value:
+                minima.pop()
+            minima.append((t, value))
+            while maxima and maxima[-1][1] <= value:
+                maxima.pop()
+            maxima.append((t, value))
+        self.samples.append((t, values))
+        self.latest = t
+        self._expire(t - self.duration)
+
+    def load(self, timestamps, values, ends, measured, outside):
+        # Replace the state with that of the given samples; ends[i] closes the span of sample i
+        self.latest = int(timestamps[-1])
+        cutoff = self.latest - self.duration
+        first = int(np.searchsorted(timestamps, cutoff, side='left'))
+        kept_times, kept = timestamps[first:], values[first:]
+        self.samples = deque(zip(kept_times.tolist(), kept.tolist()))
+        valid = ~np.isnan(kept)
+        shifted = np.where(valid, kept - np.array(self.shift), 0.0)
+        self.count = valid.sum(axis=0).tolist()
+        self.total = shifted.sum(axis=0).tolist()
+        self.squares = (shifted * shifted).sum(axis=0).tolist()
+        for i in range(kept.shape[1]):
+            times, column = kept_times[valid[:, i]], kept[valid[:, i], i]
+            # What survives in a monotonic deque: values strictly below (above) everything after them
+            later_min = np.minimum.accumulate(column[::-1])[::-1]
+            later_max = np.maximum.accumulate(column[::-1])[::-1]
+            is_min = np.append(column[:-1] < later_min[1:], len(column) > 0)[:len(column)]
+            is_max = np.append(column[:-1] > later_max[1:], len(column) > 0)[:len(column)]
+            self.minima[i] = deque(zip(times[is_min].tolist(), column[is_min].tolist()))
+            self.maxima[i] = deque(zip(times[is_max].tolist(), column[is_max].tolist()))
+        starts = timestamps[:-1]
+        keep = (ends > cutoff) & (ends > starts)
+        lengths = (ends - starts)[keep][:, None]
+        self.spans = deque(zip(starts[keep].tolist(), ends[keep].tolist(),
+                               measured[:-1][keep].tolist(), outside[:-1][keep].tolist()))
+        self.measured = (lengths * measured[:-1][keep]).sum(axis=0).tolist()
+        self.outside = (lengths * outside[:-1][keep]).sum(axis=0).tolist()
+
+    def add_span(self, start, end, measured, outside):
+        if end <= start:
+            return
+        self.spans.append((start, end, measured, outside))
+        self._add_time(end - start, measured, outside)
+
+    def summary(self, i):
+        count = self.count[i]
+        measured, outside = self.measured[i], self.outside[i]
+        if self.spans and self.latest is not None:
+            # The oldest span may begin before the window does; only its inner part counts
+            start, _, was_measured, was_outside = self.spans[0]
+            clipped = self.latest - self.duration - start
+            if clipped > 0:
+                measured -= clipped if was_measured[i] else 0
+                outside -= clipped if was_outside[i] else 0
+        if count == 0:
+            return (0, math.nan, math.nan, math.nan, math.nan, measured / 1e9, outside / 1e9, math.nan)
+        mean = self.total[i] / count
+        variance = (self.squares[i] - self.total[i] * mean) / (count - 1) if count > 1 else math.nan
+        return (count, self.shift[i] + mean, math.sqrt(max(variance, 0.0)) if count > 1 else math.nan,
+                self.minima[i][0][1], self.maxima[i][0][1], measured / 1e9, outside / 1e9,
+                100 * outside / measured if measured else math.nan)
+
+    def _expire(self, cutoff):
+        samples = self.samples
+        while samples and samples[0][0] < cutoff:
+            _, values = samples.popleft()
+            for i, value in enumerate(values):
+                if value != value:
+                    continue
+                self.count[i] -= 1
+                if self.count[i] == 0:
+                    # Start from exact zeros whenever the window empties, so rounding never accumulates
+                    self.total[i] = self.squares[i] = 0.0
+                else:
+                    delta = value - self.shift[i]
+                    self.total[i] -= delta
+                    self.squares[i] -= delta * delta
+        for extremes in self.minima + self.maxima:
+            while extremes and extremes[0][0] < cutoff:
+                extremes.popleft()
+        spans = self.spans
+        while spans and spans[0][1] <= cutoff:
+            start, end, measured, outside = spans.popleft()
+            self._add_time(start - end, measured, outside)
+
+    def _add_time(self, length, measured, outside):
+        for i in range(len(measured)):
+            if measured[i]:
+                self.measured[i] += length
+            if outside[i]:
+                self.outside[i] += length
+
+
+def stats_records(table, window=None):
+    # {window: {parameter: {stat: value}}} for JSON, with None instead of NaN
+    result = {}
+    for (label, param), row in zip(table.index, table.itertuples(index=False)):
+        if window is not None and label != window:
+            continue
+        result.setdefault(label, {})[param] = {
+            column: (None if value != value else (int(value) if column == 'count' else round(value, 6)))
+            for column, value in zip(STAT_COLUMNS, row)
+        }
+    return result
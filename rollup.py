@@ -0,0 +1,180 @@
+import numpy as np
+import pandas as pd
+
+from data_process import SENSOR_SCHEMA
+from pumping import pump_state, split_by_day
+from timeseries import catch_up
+
+PARAMETERS = list(SENSOR_SCHEMA)
+
+# How two partial aggregates of the same day are combined
+_COMBINE = {'samples': 'sum', 'flow_sum': 'sum', 'pumping_seconds': 'sum', 'pump_starts': 'sum'}
+for _param in PARAMETERS:
+    _COMBINE.update({f'{_param}_sum': 'sum', f'{_param}_count': 'sum',
+                     f'{_param}_min': 'min', f'{_param}_max': 'max'})
+
+
+class DailyRollup:
+    """Per-day quantity and quality aggregates, maintained as samples arrive.
+
+    `table` is indexed by day and holds samples, flow_sum, pumping_seconds,
+    pump_starts and <param>_min/_max/_mean (plus the _sum/_count they are
+    derived from). update() only looks at the new samples and the day they
+    extend; the table is replaced, never modified, so readers can hold on to it.
+    """
+
+    def __init__(self):
+        self.table = _empty_table()
+        self.high_water_mark = None
+        self.generation = None
+        # Last sample seen, so pumping runs continue across updates and midnight
+        self._last_timestamp = None
+        self._last_on = False
+
+    def update(self, new_rows):
+        if self.high_water_mark is not None:
+            new_rows = new_rows[new_rows['timestamp'] > self.high_water_mark]
+        if new_rows.empty:
+            return self.table
+        batch = _aggregate(new_rows, self._last_timestamp, self._last_on)
+        self.table = _merge(self.table, batch)
+        self._remember_last(new_rows)
+        return self.table
+
+    def sync(self, frame, generation=None):
+        return catch_up(self, frame, generation)
+
+    def rebuild(self, frame):
+        self.table = _empty_table()
+        self.high_water_mark = None
+        self._last_timestamp = None
+        self._last_on = False
+        return self.update(frame)
+
+    def recompute_days(self, frame, days):
+        # Backfill: redo the given days from the (already merged) store frame. A day's pumping time
+        # also depends on the pump state carried over midnight, so the days after each one are redone
+        # until one comes out unchanged
+        if frame.empty:
+            return self.rebuild(frame)
+        timestamps = frame['timestamp'].to_numpy(dtype='datetime64[ns]')
+        on = pump_state(frame['source_flow'].to_numpy(dtype=float))
+        last_day = timestamps[-1].astype('datetime64[D]')
+        table = self.table
+        requested = {np.datetime64(pd.Timestamp(day).normalize(), 'D') for day in days}
+        pending, done = sorted(requested), set()
+        while pending:
+            day = pending.pop(0)
+            if day in done:
+                continue
+            done.add(day)
+            key = pd.Timestamp(day)
+            old = table.loc[[key]] if key in table.index else None
+            new = self._aggregate_day(frame, timestamps, on, day)
+            table = table.drop(index=key, errors='ignore')
+            if new is not None:
+                table = pd.concat([table, new])
+            if day < last_day and (day in requested or not _same_rows(old, new)):
+                pending.append(day + 1)
+        self.table = table.sort_index()
+        self._last_on = bool(on[-1])
+        self._last_timestamp = frame['timestamp'].iloc[-1]
+        self.high_water_mark = self._last_timestamp
+        return self.table
+
+    @staticmethod
+    def _aggregate_day(frame, timestamps, on, day):
+        # The day's samples, the one before (pump state carried in) and the one after (the run into
+        # the next day), aggregated the way a single pass over the whole frame would
+        lo = np.searchsorted(timestamps, day.astype('datetime64[ns]'), side='left')
+        hi = np.searchsorted(timestamps, (day + 1).astype('datetime64[ns]'), side='left')
+        carry_timestamp, carry_on = (timestamps[lo - 1], bool(on[lo - 1])) if lo > 0 else (None, False)
+        rows = frame.iloc[lo:hi + 1]
+        if rows.empty:
+            return None
+        day_rows = _aggregate(rows, carry_timestamp, carry_on)
+        key = pd.Timestamp(day)
+        return _with_means(day_rows.loc[[key]]) if key in day_rows.index else None
+
+    def _remember_last(self, rows):
+        flow = rows['source_flow'].to_numpy(dtype=float)
+        self._last_on = bool(pump_state(flow, initial=self._last_on)[-1])
+        self._last_timestamp = rows['timestamp'].iloc[-1]
+        self.high_water_mark = self._last_timestamp
+
+
+def _empty_table():
+    table = pd.DataFrame({col: pd.Series(dtype=float) for col in _COMBINE})
+    table.index = pd.DatetimeIndex([], name='date')
+    return _with_means(table)
+
+
+def _aggregate(rows, carry_timestamp=None, carry_on=False):
+    timestamps = rows['timestamp'].to_numpy(dtype='datetime64[ns]')
+    days = timestamps.astype('datetime64[D]')
+    flow = rows['source_flow'].to_numpy(dtype=float)
+    on = pump_state(flow, initial=carry_on)
+
+    # Pumping time is the sum of the gaps that start while the pump is running
+    if carry_timestamp is not None:
+        gap_times = np.concatenate([[np.datetime64(carry_timestamp, 'ns')], timestamps])
+        gap_on = np.concatenate([[carry_on], on])
+    else:
+        gap_times, gap_on = timestamps, on
+    starts, ends = gap_times[:-1][gap_on[:-1]], gap_times[1:][gap_on[:-1]]
+    piece_days, seconds = split_by_day(starts, ends)
+    previous_on = np.concatenate([[carry_on], on[:-1]])
+    start_days = days[on & ~previous_on]
+
+    grouped = {
+        'samples': pd.Series(1, index=days).groupby(level=0).sum(),
+        'flow_sum': pd.Series(flow, index=days).groupby(level=0).sum(),
+        'pumping_seconds': pd.Series(seconds, index=piece_days).groupby(level=0).sum(),
+        'pump_starts': pd.Series(1, index=start_days).groupby(level=0).sum(),
+    }
+    for param in PARAMETERS:
+        values = pd.Series(rows[param].to_numpy(dtype=float) if param in rows else np.nan, index=days)
+        by_day = values.groupby(level=0)
+        grouped[f'{param}_sum'] = by_day.sum()
+        grouped[f'{param}_count'] = by_day.count()
+        grouped[f'{param}_min'] = by_day.min()
+        grouped[f'{param}_max'] = by_day.max()
+
+    batch = pd.DataFrame(grouped).astype(float)
+    counts = ['samples', 'flow_sum', 'pumping_seconds', 'pump_starts'] + \
+             [f'{param}_{agg}' for param in PARAMETERS for agg in ('sum', 'count')]
+    batch[counts] = batch[counts].fillna(0.0)
+    batch.index = pd.DatetimeIndex(batch.index, name='date')
+    return batch
+
+
+def _merge(table, batch):
+    first = batch.index[0]
+    position = table.index.searchsorted(first)
+    head, tail = table.iloc[:position], table.iloc[position:]
+    if not tail.empty:
+        batch = pd.concat([tail[list(_COMBINE)], batch]).groupby(level=0).agg(_COMBINE)
+    if head.empty:
+        return _with_means(batch)
+    return pd.concat([head, _with_means(batch)])
+
+
+def _same_rows(old, new):
+    if old is None or new is None:
+        return old is None and new is None
+    columns = list(_COMBINE)
+    return np.allclose(old[columns].to_numpy(dtype=float), new[columns].to_numpy(dtype=float),
+                       rtol=1e-9, atol=1e-9, equal_nan=True)
+
+
+def add_means(table, parameters=PARAMETERS):
+    # <param>_mean from the <param>_sum and _count columns the table has; NaN where nothing was counted
+    for param in parameters:
+        if f'{param}_count' in table:
+            count = table[f'{param}_count']
+            table[f'{param}_mean'] = table[f'{param}_sum'].where(count > 0) / count.where(count > 0)
+    return table
+
+
+def _with_means(table):
+    return add_means(table[list(_COMBINE)].copy())
@@ -0,0 +1,35 @@
+import json
+import os
+from collections import namedtuple
+
+SITES_FILE = os.environ.get('SITES_FILE', 'sites.json')
+
+# One village scheme: where its sensor data comes from and which survey sheet
+# and boundary make up its map. `min_request_interval` (seconds between API
+# calls) and `timeout` (connect, read) are per site, so a slow or strict API
+# does not hold up the others.
+Site = namedtuple('Site', [
+    'slug', 'name', 'title', 'api_url', 'data_path', 'excel_path', 'excel_sheet', 'geojson_path',
+    'boundary_name', 'population', 'min_request_interval', 'timeout'
+], defaults=['BOTH_WQ.xlsx', None, None, None, 10000, 0.0, (10, 60)])
+
+
+def load_sites(path=SITES_FILE):
+    with open(path) as f:
+        entries = json.load(f)
+    sites = {}
+    for entry in entries:
+        if 'timeout' in entry:
+            entry['timeout'] = tuple(entry['timeout'])
+        site = Site(**entry)
+        if not site.slug or '/' in site.slug or site.slug in sites:
+            raise ValueError(f"Invalid or duplicate site slug: {site.slug!r}")
+        sites[site.slug] = site
+    if not sites:
+        raise ValueError(f"No sites configured in {path}")
+    return sites
+
+
+SITES = load_sites()
+# The first site in the registry is what /dashboard/ shows
+DEFAULT_SITE = next(iter(SITES))
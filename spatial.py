@@ -0,0 +1,110 @@
+import json
+import math
+from functools import lru_cache
+
+import numpy as np
+
+from map_builder import TDS_COLUMN, load_excel_data, load_geojson, survey_points_layer, tds_colormap
+
+LAYERS = ('samples', 'boundaries')
+# Zoom levels are those of web map tiles: at zoom z, 256 pixels span 360 / 2**z degrees of longitude
+MAX_ZOOM = 22
+TILE_PIXELS = 256
+# Below this zoom, samples within SAMPLE_CELL_PIXELS of each other are thinned to the highest TDS one
+FULL_DETAIL_ZOOM = 17
+SAMPLE_CELL_PIXELS = 4
+FEATURE_CACHE_SIZE = 512
+EARTH_RADIUS_M = 6371008.8
+
+
+class SpatialIndex:
+    """STRtree indexes over a site's survey samples and boundaries.
+
+    features() returns the GeoJSON of one layer inside a bbox: the tree gives
+    the candidates, boundaries are simplified to about a pixel at the
+    requested zoom and dense samples are thinned. The bbox is widened to the
+    tile grid of its zoom so that nearby requests share the cached answer.
+    lookup() finds the nearest sample and the boundaries around a point with
+    tree queries too, so neither scales with the number of features.
+    """
+
+    def __init__(self, site):
+        import shapely
+
+        points = load_excel_data(site.excel_path, site.excel_sheet).to_crs(epsg=4326)
+        self.lon = points.geometry.x.to_numpy()
+        self.lat = points.geometry.y.to_numpy()
+        self.tds = points[TDS_COLUMN].to_numpy(dtype=float)
+        layer = survey_points_layer(points, tds_colormap(points))
+        self.sample_properties = json.loads(layer.drop(columns='geometry').to_json(orient='records'))
+        # Longitudes are scaled to the site's latitude, so the tree's nearest is the nearest on the ground
+        self.x_scale = math.cos(math.radians(np.mean(self.lat))) if len(self.lat) else 1.0
+        self.sample_tree = shapely.STRtree(shapely.points(self.lon * self.x_scale, self.lat))
+
+        boundaries = load_geojson(site.geojson_path).to_crs(epsg=4326)
+        boundaries = boundaries[boundaries.geometry.notna() & ~boundaries.geometry.is_empty]
+        self.boundaries = np.asarray(boundaries.geometry)
+        self.boundary_properties = json.loads(boundaries.drop(columns='geometry').to_json(orient='records'))
+        self.boundary_tree = shapely.STRtree(self.boundaries)
+        self._cached = lru_cache(maxsize=FEATURE_CACHE_SIZE)(self._collect)
+
+    def features(self, layer, bbox, zoom):
+        # GeoJSON text of `layer` within bbox = (min lon, min lat, max lon, max lat)
+        zoom = min(max(int(zoom), 0), MAX_ZOOM)
+        tile = 360.0 / 2 ** zoom
+        tiles = (math.floor(bbox[0] / tile), math.floor(bbox[1] / tile),
+                 math.ceil(bbox[2] / tile), math.ceil(bbox[3] / tile))
+        return self._cached(layer, zoom, tiles)
+
+    def lookup(self, lon, lat):
+        import shapely
+
+        nearest = None
+        if len(self.lon):
+            i = int(self.sample_tree.nearest(shapely.Point(lon * self.x_scale, lat)))
+            nearest = dict(self.sample_properties[i], lon=float(self.lon[i]), lat=float(self.lat[i]),
+                           distance_m=round(_haversine(lon, lat, self.lon[i], self.lat[i]), 1))
+        inside = np.sort(self.boundary_tree.query(shapely.Point(lon, lat), predicate='intersects'))
+        return {'nearest': nearest, 'boundaries': [self.boundary_properties[i] for i in inside]}
+
+    def _collect(self, layer, zoom, tiles):
+        import shapely
+
+        tile = 360.0 / 2 ** zoom
+        min_lon, min_lat, max_lon, max_lat = (i * tile for i in tiles)
+        pixel = tile / TILE_PIXELS
+        if layer == 'samples':
+            found = self.sample_tree.query(shapely.box(min_lon * self.x_scale, min_lat,
+                                                       max_lon * self.x_scale, max_lat))
+            features = [{'type': 'Feature', 'properties': self.sample_properties[i],
+                         'geometry': {'type': 'Point', 'coordinates': [float(self.lon[i]), float(self.lat[i])]}}
+                        for i in self._thin(found, pixel, zoom)]
+        else:
+            found = np.sort(self.boundary_tree.query(shapely.box(min_lon, min_lat, max_lon, max_lat)))
+            simplified = shapely.simplify(self.boundaries[found], pixel, preserve_topology=True)
+            features = [{'type': 'Feature', 'properties': self.boundary_properties[i],
+                         'geometry': shapely.geometry.mapping(geometry)}
+                        for i, geometry in zip(found, simplified)]
+        return json.dumps({'type': 'FeatureCollection', 'features': features}, separators=(',', ':'))
+
+    def _thin(self, found, pixel, zoom):
+        if zoom >= FULL_DETAIL_ZOOM or len(found) < 2:
+            return np.sort(found)
+        # Highest TDS first (NaN last), so the sample kept in each cell is the worst one
+        order = found[np.argsort(-self.tds[found], kind='stable')]
+        cell = pixel * SAMPLE_CELL_PIXELS
+        cells = np.column_stack([np.floor(self.lon[order] / cell), np.floor(self.lat[order] / cell)])
+        _, first = np.unique(cells, axis=0, return_index=True)
+        return np.sort(order[first])
+
+
+@lru_cache(maxsize=None)
+def spatial_index(site):
+    # Built on first use, so workers only load geopandas and shapely when a map asks for features
+    return SpatialIndex(site)
+
+
+def _haversine(lon1, lat1, lon2, lat2):
+    lon1, lat1, lon2, lat2 = map(math.radians, (lon1, lat1, lon2, lat2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
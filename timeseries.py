@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+
+class TimeSeries:
+    """Binary-search window queries over a frame sorted by 'timestamp'.
+
+    Every store in this app keeps its rows in timestamp order, so windows are
+    found with np.searchsorted (O(log n)) and returned as iloc slices. Those
+    slices are views, not copies; treat them as read-only. Building a
+    TimeSeries is O(1).
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self._timestamps = df['timestamp'].to_numpy() if 'timestamp' in df else np.array([], dtype='datetime64[ns]')
+
+    def __len__(self):
+        return len(self._timestamps)
+
+    @property
+    def empty(self):
+        return len(self._timestamps) == 0
+
+    @property
+    def index(self):
+        # Monotonic DatetimeIndex over the same timestamps (no copy)
+        return pd.DatetimeIndex(self._timestamps, copy=False)
+
+    @property
+    def start(self):
+        return pd.Timestamp(self._timestamps[0]) if len(self) else None
+
+    @property
+    def end(self):
+        return pd.Timestamp(self._timestamps[-1]) if len(self) else None
+
+    def latest(self):
+        # Last reading as a Series, or an empty Series when there is no data
+        if self.empty:
+            return pd.Series(dtype=object)
+        return self.df.iloc[-1]
+
+    def between(self, start, end, inclusive='both'):
+        lo = self._position(start, 'left' if inclusive in ('both', 'left') else 'right')
+        hi = self._position(end, 'right' if inclusive in ('both', 'right') else 'left')
+        return self.df.iloc[lo:max(lo, hi)]
+
+    def last(self, duration):
+        # The window [latest - duration, latest], as the dashboard's TIME_DURATIONS use it
+        if self.empty:
+            return self.df
+        end = self.end
+        return self.between(end - pd.Timedelta(duration), end)
+
+    def after(self, value):
+        # Rows strictly newer than value
+        return self.df.iloc[self._position(value, 'right'):]
+
+    def day(self, date):
+        start = pd.Timestamp(date).normalize()
+        return self.between(start, start + pd.Timedelta(days=1), inclusive='left')
+
+    def days(self, start_date, end_date):
+        # Whole calendar days from start_date through end_date
+        start = pd.Timestamp(start_date).normalize()
+        end = pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1)
+        return self.between(start, end, inclusive='left')
+
+    def _position(self, value, side):
+        return int(np.searchsorted(self._timestamps, np.datetime64(pd.Timestamp(value), 'ns'), side=side))
+
+
+def catch_up(aggregate, frame, generation=None):
+    """Bring an incremental aggregate up to date with a time-ordered store frame.
+
+    `aggregate` is anything with generation, high_water_mark, update() and
+    rebuild() (DailyRollup, RollingStats, AggregatePyramid). A new store
+    generation means history was rewritten, so it is rebuilt; otherwise only
+    the rows after its high-water mark are passed to update().
+    """
+    if generation != aggregate.generation:
+        aggregate.generation = generation
+        return aggregate.rebuild(frame)
+    if aggregate.high_water_mark is None:
+        return aggregate.update(frame)
+    return aggregate.update(TimeSeries(frame).after(aggregate.high_water_mark))